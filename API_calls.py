@@ -57,6 +57,14 @@ def generate_article_for_dashboard(title, source, url, date, news_content, match
     article_generator = ArticleGeneration(MODEL, API_KEY)
     return article_generator.gpt_generate_article(title, source, url, date, news_content, matched_keywords)
 
+def stream_translation_for_dashboard(content, src_lang='en', dest_lang='fa'):
+    translator = Translation(MODEL, API_KEY)
+    return translator.gpt_translate_stream(content, src_lang, dest_lang)
+
+def stream_article_for_dashboard(title, source, url, date, news_content, matched_keywords=None):
+    article_generator = ArticleGeneration(MODEL, API_KEY)
+    return article_generator.gpt_generate_article_stream(title, source, url, date, news_content, matched_keywords)
+
 def generate_images_for_dashboard(prompt, num_images=1):
     image_generator = ImageGeneration(api_key=API_KEY)
     generated_urls = image_generator.gpt_generate_images(prompt, num_images=num_images)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+
+
+class BlobStore(ABC):
+    """Content-addressed storage: blobs are written and read by the SHA-256 of their bytes."""
+
+    @abstractmethod
+    def put(self, data):
+        """Store data durably and return its hash. Storing the same bytes twice keeps one copy.
+
+        Once put returns, the blob must survive a crash: callers delete other copies of
+        the bytes right after.
+        """
+
+    @abstractmethod
+    def get(self, blob_hash):
+        """Return the bytes stored under blob_hash, or None."""
+
+    @abstractmethod
+    def exists(self, blob_hash):
+        pass
+
+    @abstractmethod
+    def delete(self, blob_hash):
+        pass
+
+
+def _fsync_directory(path):
+    """Make entries renamed into or created in a directory durable. No-op where directories
+    cannot be opened (Windows)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under root, sharded by the first two byte pairs of the hash (ab/cd/abcd...)."""
+
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def path(self, blob_hash):
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def put(self, data):
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            return blob_hash
+        shard_directory = os.path.dirname(path)
+        new_shard = not os.path.isdir(shard_directory)
+        os.makedirs(shard_directory, exist_ok=True)
+        # Write under a unique name and rename, so readers never see a partial blob and
+        # concurrent writers of the same bytes simply replace each other's identical file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        _fsync_directory(shard_directory)
+        if new_shard:
+            _fsync_directory(os.path.dirname(shard_directory))
+            _fsync_directory(self.root)
+        return blob_hash
+
+    def get(self, blob_hash):
+        # Callers decode the whole image, so a plain read is as cheap as mapping the file
+        try:
+            with open(self.path(blob_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, blob_hash):
+        return os.path.exists(self.path(blob_hash))
+
+    def delete(self, blob_hash):
+        try:
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+
+
+# Backends selectable with BLOB_STORE_BACKEND; register other stores (e.g. object storage) here
+BLOB_STORES = {
+    'local': LocalBlobStore,
+}
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Return the process-wide blob store configured by BLOB_STORE_BACKEND."""
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            if BLOB_STORE_BACKEND not in BLOB_STORES:
+                raise ValueError(f"Unknown blob store backend {BLOB_STORE_BACKEND!r}")
+            _blob_store = BLOB_STORES[BLOB_STORE_BACKEND]()
+        return _blob_store
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+from html import escape
+
+from bs4 import BeautifulSoup
+from cachetools import LRUCache
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+
+_render_cache = LRUCache(maxsize=RENDER_CACHE_SIZE)
+_render_cache_lock = threading.Lock()
+
+
+def _image_html(element):
+    image_url = element.get('src') or ''
+    # Only plain web images; anything else (javascript:, data:) is dropped
+    if not image_url.startswith(('http://', 'https://', '//')):
+        return ''
+    image_alt = escape(element.get('alt') or '')
+    if image_url.endswith('.svg'):
+        # Display the SVG icon with the text side by side
+        return (
+            f'<div style="display: inline-flex; align-items: center;">'
+            f'<img src="{escape(image_url)}" width="25px" alt="{image_alt}" style="margin-right: 10px;"/>'
+            f'<span>{image_alt}</span></div>'
+        )
+    return f'<div><img src="{escape(image_url)}" alt="{image_alt}" style="width: 1000px;"/></div>'
+
+
+def article_html(content, direction, align, font_family):
+    """Render article HTML as one styled fragment for a single st.markdown call.
+
+    Only paragraphs, images, lists and blockquotes at the top level are kept, as text
+    (escaped) or as rebuilt tags, so no markup from the source page reaches the browser.
+    """
+    parts = []
+    for element in BeautifulSoup(content or '', 'html.parser').children:
+        if element.name == 'p':
+            parts.append(f"<p>{escape(element.get_text())}</p>")
+        elif element.name == 'img':
+            parts.append(_image_html(element))
+        elif element.name == 'ul':
+            items = "".join(f"<li>{escape(li.get_text())}</li>" for li in element.find_all('li'))
+            parts.append(f"<ul>{items}</ul>")
+        elif element.name == 'blockquote':
+            parts.append(f"<blockquote>{escape(element.get_text())}</blockquote>")
+    return (
+        f'<div style="{escape(f"direction: {direction}; text-align: {align}; font-family: {font_family};")}">'
+        f'{"".join(parts)}</div>'
+    )
+
+
+def cached_article_html(content, direction, align, font_family):
+    """article_html memoized by (content hash, direction, align, font) in a bounded LRU cache."""
+    key = (hashlib.sha256((content or '').encode('utf-8')).hexdigest(), direction, align, font_family)
+    with _render_cache_lock:
+        fragment = _render_cache.get(key)
+    if fragment is None:
+        fragment = article_html(content, direction, align, font_family)
+        with _render_cache_lock:
+            _render_cache[key] = fragment
+    return fragment
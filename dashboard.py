@@ -2,12 +2,18 @@ import streamlit as st
 from datetime import datetime, timedelta
 import pandas as pd
 import plotly.express as px
-import tldextract
 from database import DatabaseManager
-from bs4 import BeautifulSoup
-import re
+from snapshot import ContentSnapshot
+from domains import extract_domains
+from image_cache import get_image_cache
+from keyword_matcher import compile_keywords
+from enrichment import html_to_text
+from content_renderer import article_html, cached_article_html
+from cachetools import LRUCache
 from API_calls import *
 import io
+import requests
+import time
 
 # Set page config only once at the start of the script
 st.set_page_config(
@@ -16,10 +22,29 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def get_content_snapshot():
+    """Load the content table once per process; all sessions share this snapshot."""
+    snapshot_db = DatabaseManager()
+    snapshot_db.connect()
+    snapshot = ContentSnapshot(snapshot_db)
+    snapshot.load()
+    snapshot.start()
+    return snapshot
+
+
 # Connect to the database
 db_manager = DatabaseManager()
 db_manager.connect()
-news_data = db_manager.load_content_data()
+content_snapshot = get_content_snapshot()
+news_data = content_snapshot.frame()
+
+NEWS_PAGE_SIZES = [10, 20, 50, 100]
+# Streamed GPT output is redrawn at most this often, not once per token
+STREAM_RENDER_INTERVAL = 0.1
+NEWS_PAGE_SIZE = 20
+# Plain-text bodies kept in memory for keyword matching across reruns and sessions
+PLAIN_TEXT_CACHE_SIZE = 20000
 
 # Language selection
 # language = st.sidebar.radio("انتخاب زبان", ("فارسی", "انگلیسی"))
@@ -85,106 +110,35 @@ st.markdown(
     #     font-family: {content_font_family}
     # }}
 
-def filter_news(data, title_search='', content_keywords='', sources=None, start_date=None, end_date=None):
-    """Filter news data based on the user's input criteria."""
-    if title_search:
-        data = pd.concat([
-            data[data['title_persian'].str.contains(title_search, case=False, na=False)],
-            data[data['title'].str.contains(title_search, case=False, na=False)]
-        ])
-
-    
-    if content_keywords:
-        # Split keywords by comma, strip whitespaces, and filter
-        keywords = [kw.strip() for kw in content_keywords.split(',')]
-        if keywords:
-            keyword_pattern = '|'.join(keywords)  # Create regex pattern with OR between keywords
-            data = pd.concat([
-                data[data['content_persian'].str.contains(keyword_pattern, case=False, na=False)],
-                data[data['content'].str.contains(keyword_pattern, case=False, na=False)]
-            ])
-
-    
-    if sources and "همه" not in sources:
-        # If specific sources are selected, filter by those sources
-        data = data[data['source'].isin(sources)]
-    
-    if start_date and end_date:
-        start_date = pd.to_datetime(start_date)
-        end_date = pd.to_datetime(end_date)
-        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    
-    return data
-
-def extract_domain(url):
-    """Extract domain from the URL."""
-    domain = tldextract.extract(url).registered_domain
-    return domain
-
-def render_content(content, language='fa'):
+def content_style():
+    """(direction, align, font family) for the selected content language."""
     if 'language_option' not in st.session_state:
         st.session_state['language_option'] = 'انگلیسی'
         
     language_option = st.session_state['language_option']
 
     if language_option == "انگلیسی": 
-        content_direction = "ltr"
-        content_align = "left"
-        content_font_family = '"Arial", sans-serif'
-    else:
-        content_direction = "rtl"
-        content_align = "right"
-        content_font_family = '"IRANSans", sans-serif'
-        
-    def render_html(soup):
-        for element in soup.children:
-            if element.name == 'p':
-                text = element.get_text()
-                # Apply CSS directly to each <p> tag
-                st.markdown(
-                    f"""
-                    <p style="direction: {content_direction}; text-align: {content_align}; font-family: {content_font_family};">
-                    {text}
-                    </p>
-                    """, 
-                    unsafe_allow_html=True
-                )
-            elif element.name == 'img':
-                image_url = element.get('src')
-                image_alt = element.get('alt')
-                # Apply styles to images
-                image_style = f"direction: {content_direction}; text-align: {content_align}; font-family: {content_font_family};"
-                
-                if image_url.endswith('.svg'):
-                    # Display the SVG icon with the text side by side
-                    st.markdown(
-                        f"""
-                        <div style="{image_style}; display: inline-flex; align-items: center;">
-                            <img src="{image_url}" width="25px" alt="{image_alt}" style="margin-right: 10px;"/>
-                            <span>{image_alt}</span>
-                        </div>
-                        """, 
-                        unsafe_allow_html=True
-                    )
-                else:
-                    # For non-SVG images, style as before
-                    st.markdown(
-                        f"""
-                        <div style="{image_style}">
-                            <img src="{image_url}" style="width: 1000px;"/>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-            elif element.name == 'ul':
-                for li in element.find_all('li'):
-                    st.markdown(f"- {li.get_text()}", unsafe_allow_html=True)
-            elif element.name == 'blockquote':
-                st.markdown(f"> {element.get_text()}", unsafe_allow_html=True)
-
-    # Call render_html with your styles
-    soup = BeautifulSoup(content, 'html.parser')
-    render_html(soup)
+        return "ltr", "left", '"Arial", sans-serif'
+    return "rtl", "right", '"IRANSans", sans-serif'
+
+
+def render_content(content, language='fa'):
+    # One cached fragment and one websocket message per article, instead of one per element
+    st.markdown(cached_article_html(content, *content_style()), unsafe_allow_html=True)
+
+
+def render_stream(chunks, render):
+    """Collect streamed text chunks, calling render with the text so far at most every
+    STREAM_RENDER_INTERVAL seconds and once at the end. Returns the full text."""
+    text = ''
+    last_render = 0.0
+    for chunk in chunks:
+        text += chunk
+        if time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+            render(text)
+            last_render = time.monotonic()
+    render(text)
+    return text
 
 
 
@@ -199,34 +153,50 @@ def keyword_weight_input():
     return keyword_weight_pairs
 
 def clean_content(content):
-    # Remove HTML tags
-    soup = BeautifulSoup(content, 'html.parser')
-    text = soup.get_text()
-
-    # Remove extra spaces and newlines
-    text = re.sub(r'\s+', ' ', text).strip()
+    return html_to_text(content)
+
+@st.cache_resource
+def get_plain_text_cache():
+    """Lowercased plain text of content bodies by id, shared by every session."""
+    return LRUCache(maxsize=PLAIN_TEXT_CACHE_SIZE)
+
+
+def load_plain_texts(ids):
+    """Return the lowercased plain text of each content id, loading it only on a cache miss."""
+    cache = get_plain_text_cache()
+    # Collected locally first: with more ids than the cache holds, or other sessions
+    # filling it concurrently, entries could be evicted before they are read back
+    plain_texts = {}
+    missing = []
+    for content_id in ids:
+        text = cache.get(content_id)
+        if text is None:
+            missing.append(content_id)
+        else:
+            plain_texts[content_id] = text
+    if missing:
+        texts = db_manager.load_content_texts(missing)
+        loaded = {}
+        for content_id, content_text, content in zip(texts['id'], texts['content_text'], texts['content']):
+            if not isinstance(content_text, str):
+                # Not backfilled yet
+                content_text = clean_content(content) if isinstance(content, str) else ''
+            loaded[content_id] = content_text.lower()
+        plain_texts.update(loaded)
+        cache.update(loaded)
+    return [plain_texts.get(content_id, '') for content_id in ids]
 
-    return text
 
 def filter_by_keywords(news_data, keyword_weight_pairs):
-    news_data['matched_keywords'] = None  # Add a column to store matched keywords
-
-    for index, row in news_data.iterrows():
-        content_cleaned = clean_content(row['content'])
-        matched_keywords = []
-
-        # Check if each keyword exists in the content with at least the specified weight
-        for keyword, weight in keyword_weight_pairs:
-            count = content_cleaned.lower().count(keyword.lower())
-            if count >= weight:
-                matched_keywords.append(keyword)
+    matcher = compile_keywords(keyword_weight_pairs)
+    if not matcher:
+        return news_data.assign(matched_keywords=None)
 
-        # If at least one keyword matches the criteria, update the 'matched_keywords' column
-        if matched_keywords:
-            news_data.at[index, 'matched_keywords'] = matched_keywords
-
-    # Return the modified news_data
-    return news_data.dropna(subset=['matched_keywords'])
+    # The snapshot only holds the list projection, so match against cached plain text
+    # of the candidates' bodies. This also leaves the shared snapshot untouched.
+    mask, matched_keywords = matcher.match(load_plain_texts(news_data['id'].tolist()))
+    news_data = news_data.assign(matched_keywords=matched_keywords)
+    return news_data[mask]
 
 
 
@@ -236,7 +206,7 @@ def all_news_page():
 
     # Filtering options
     st.sidebar.header("🔍 فیلتر کردن اخبار")
-    title_search = st.sidebar.text_input("جستجو در عنوان")
+    title_search = st.sidebar.text_input("جستجو در عنوان و متن", help="کلمات با فاصله: همه باید باشند. OR: یکی کافی است. *: پیشوند")
 
     # Use the keyword_weight_input function for keyword-weight pair input
     content_keywords = keyword_weight_input()
@@ -246,7 +216,6 @@ def all_news_page():
     unique_sources = sorted(unique_sources)
     unique_sources.insert(0, "همه")
 
-    news_data['domain'] = news_data['url'].apply(extract_domain)
     unique_domains = news_data['domain'].dropna().unique()
     unique_domains = sorted(unique_domains)
     unique_domains.insert(0, "همه")
@@ -267,42 +236,78 @@ def all_news_page():
     sort_by = st.sidebar.selectbox("مرتب‌سازی بر اساس", 
                                    ["تاریخ", "عنوان", "منبع", "امتیاز نهایی"])
     sort_order = st.sidebar.radio("ترتیب مرتب‌سازی", ["نزولی", "صعودی"])
-
-    # Apply filtering by keywords and other criteria
-    filtered_data = filter_by_keywords(news_data, content_keywords)
-
-    filtered_data = filter_news(
-        filtered_data,
-        title_search,
-        None,
-        source_filter if "همه" not in source_filter else None,
-        start_date,
-        end_date
-    )
-    
-    if domain_filter != "همه":
-        filtered_data = filtered_data[filtered_data['domain'] == domain_filter]
-
-    if type_filter != "همه":
-        filtered_data = filtered_data[filtered_data['type'] == type_filter]
-
-    sort_map = {'تاریخ': 'date', 'عنوان': 'title_persian', 'منبع': 'source', 'امتیاز نهایی': 'final_score'}
-    filtered_data = filtered_data.sort_values(by=sort_map[sort_by], ascending=(sort_order == "صعودی"))
-
-    # Display filtered news articles
-    for index, row in filtered_data.iterrows():
+    page_size = st.sidebar.selectbox("تعداد خبر در هر صفحه", NEWS_PAGE_SIZES, index=NEWS_PAGE_SIZES.index(NEWS_PAGE_SIZE))
+
+    # Filtering, sorting and paging run in SQL; only one page of rows is loaded
+    filters = {
+        'sources': source_filter if "همه" not in source_filter else None,
+        'domain': domain_filter if domain_filter != "همه" else None,
+        'type': type_filter if type_filter != "همه" else None,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+
+    sort_map = {'تاریخ': 'date', 'عنوان': 'title', 'منبع': 'source', 'امتیاز نهایی': 'final_score'}
+    sort = (sort_map[sort_by], 'asc' if sort_order == "صعودی" else 'desc')
+
+    # Start from the first page whenever the filters change. news_cursors holds the
+    # keyset cursor of every page visited so far, so "previous" can step back.
+    filters_signature = repr((filters, title_search, sort, content_keywords, page_size))
+    if st.session_state.get('news_filters_signature') != filters_signature:
+        st.session_state['news_filters_signature'] = filters_signature
+        st.session_state['news_cursors'] = [None]
+    news_cursors = st.session_state['news_cursors']
+
+    # Text search goes through the inverted index; its ids narrow down the SQL query
+    if title_search.strip():
+        filters['ids'] = sorted(db_manager.search_content_ids(title_search))
+
+    # Keyword weights cannot be expressed in SQL, so match them on the candidates' stored text
+    # and narrow the query down to the matching ids
+    matched_keywords = {}
+    if any(keyword for keyword, _ in content_keywords):
+        candidates = pd.DataFrame({'id': db_manager.query_content_ids(filters)})
+        keyword_matches = filter_by_keywords(candidates, content_keywords)
+        matched_keywords = dict(zip(keyword_matches['id'], keyword_matches['matched_keywords']))
+        filters['ids'] = list(matched_keywords)
+
+    page_data, next_cursor = db_manager.query_content(filters, sort, page_size=page_size, cursor=news_cursors[-1])
+    total_count = db_manager.count_content(filters)
+    page_count = max((total_count + page_size - 1) // page_size, 1)
+    st.caption(f"صفحه {len(news_cursors)} از {page_count} | {total_count} خبر")
+    if not page_data.empty:
+        missing_domain = page_data['domain'].isna() & page_data['url'].notna()
+        if missing_domain.any():
+            page_data.loc[missing_domain, 'domain'] = extract_domains(page_data.loc[missing_domain, 'url'])
+        page_data['matched_keywords'] = [matched_keywords.get(content_id) for content_id in page_data['id']]
+
+    # Display the current page of news articles
+    for index, row in page_data.iterrows():
         with st.expander(f"### {row['title_persian']}" if row['title_persian'] and language == "فارسی" else f"### {row['title']}"):
             st.markdown(f"**تاریخ**: {row['date']} | **منبع**: {row['source']} | **وب‌سایت**: {row['domain']} | **بازدیدها**: {row['views']}")
-            st.markdown(f"**خلاصه**: {row['summary_persian'][:200] if row['summary_persian'] and language == 'فارسی' else row['summary'][:200]}...")
+            st.markdown(f"**خلاصه**: {row['snippet']}...")
 
             if row['matched_keywords']:
                 st.markdown(f"**کلمات کلیدی مطابق**: {', '.join(row['matched_keywords'])}")
 
-            if st.button("مشاهده جزئیات", key=f"btn_{index}"):
+            if st.button("مشاهده جزئیات", key=f"btn_{row['id']}"):
                 st.session_state['selected_news_id'] = row['id']
+                st.session_state['selected_matched_keywords'] = row['matched_keywords'] or []
                 st.session_state['current_page'] = 'جزئیات خبر'
                 st.experimental_rerun()
 
+    first_column, previous_column, next_column = st.columns(3)
+    if len(news_cursors) > 1:
+        if first_column.button("بازگشت به صفحه اول"):
+            st.session_state['news_cursors'] = [None]
+            st.experimental_rerun()
+        if previous_column.button("صفحه قبل"):
+            st.session_state['news_cursors'] = news_cursors[:-1]
+            st.experimental_rerun()
+    if next_cursor is not None:
+        if next_column.button("صفحه بعد"):
+            st.session_state['news_cursors'] = news_cursors + [next_cursor]
+            st.experimental_rerun()
 
 
 
@@ -312,7 +317,16 @@ def news_details_page():
         return
 
     news_id = st.session_state['selected_news_id']
-    selected_news = news_data[news_data['id'] == news_id].iloc[0]
+    selected_news = content_snapshot.row(news_id)
+    if selected_news is None:
+        st.error("خبر مورد نظر یافت نشد.")
+        return
+    # Body, tags and image references in one keyed round trip
+    details = db_manager.load_content_details(news_id)
+    if details is None:
+        st.error("خطا در بارگذاری متن خبر")
+        return
+    body = details['body']
 
     # Set default language
     if 'language' not in st.session_state:
@@ -322,16 +336,16 @@ def news_details_page():
 
     # Set fields based on selected language
     title = selected_news['title_persian'] if selected_news['title_persian'] and language == "فارسی" else selected_news['title']
-    summary = selected_news['summary_persian'] if selected_news['summary_persian'] and language == "فارسی" else selected_news['summary']
-    content = selected_news['content'] if selected_news['content'] or language == "English" else selected_news['content_persian']
-    matched_keywords = selected_news.get('matched_keywords', [])
+    summary = body['summary_persian'] if body['summary_persian'] and language == "فارسی" else body['summary']
+    content = body['content'] if body['content'] or language == "English" else body['content_persian']
+    matched_keywords = st.session_state.get('selected_matched_keywords', [])
     title_api = selected_news['title_persian'] if selected_news['title'] else selected_news['title_persian']
-    summary_api = selected_news['summary'] if selected_news['summary'] else selected_news['summary_persian']
+    summary_api = body['summary'] if body['summary'] else body['summary_persian']
 
     st.title(title)
     st.write(f"**تاریخ**: {selected_news['date']}")
     st.write(f"**منبع**: {selected_news['source']}")
-    st.write(f"**وب‌سایت**: {extract_domain(selected_news['url'])}")
+    st.write(f"**وب‌سایت**: {selected_news['domain']}")
     st.write(f"**نویسنده**: {selected_news['author']}")
     st.write(f"**بازدیدها**: {selected_news['views']}")
     st.write(f"**امتیاز نهایی**: {selected_news['final_score']}")
@@ -351,9 +365,9 @@ def news_details_page():
     if language_option == "فارسی":
         st.markdown("### محتوا (فارسی)")
         
-        if selected_news['content_persian']:
+        if body['content_persian']:
             # Display existing Persian content
-            render_content(selected_news['content_persian'])
+            render_content(body['content_persian'])
         else:
             # Inform the user that no Persian content exists and prompt for translation
             st.write("محتوای فارسی موجود نیست. لطفا ترجمه کنید.")
@@ -370,8 +384,15 @@ def news_details_page():
                 st.error("خطا در ترجمه جدید")
 
         elif st.button("ترجمه با GPT"):
-            # Perform translation using GPT
-            translation = translate_for_dashboard(content, 'en', 'fa', True)
+            # Show the GPT translation as it is generated; it is stored once the stream is complete
+            translation_placeholder = st.empty()
+            draw_translation = lambda text: translation_placeholder.markdown(
+                article_html(text, *content_style()), unsafe_allow_html=True
+            )
+            try:
+                translation = render_stream(stream_translation_for_dashboard(content, 'en', 'fa'), draw_translation).strip()
+            except requests.exceptions.RequestException:
+                translation = ''
             if translation:
                 db_manager.insert_translation(news_id, translation)
                 st.success("ترجمه با موفقیت انجام شد.")
@@ -390,33 +411,57 @@ def news_details_page():
         st.write("خلاصه ای برای این مقاله یافت نشد.")
     
     st.markdown("### مقاله")
+    generated_articles = st.session_state.setdefault('generated_articles', {})
     if st.button("📝 تولید مقاله از این خبر"):
-        generated_article = generate_article_for_dashboard(
-            title_api, 
-            selected_news['source'], 
-            selected_news['url'], 
-            selected_news['date'], 
-            content,
-            matched_keywords=matched_keywords
-        )
-
-        if generated_article and generated_article != "No Article":
-            with st.expander("🔍 مشاهده مقاله تولید شده (برای بستن کلیک کنید)"):
-                st.write(generated_article)
+        # Render the article as it is generated instead of after the whole response
+        with st.expander("🔍 مشاهده مقاله تولید شده (برای بستن کلیک کنید)", expanded=True):
+            article_placeholder = st.empty()
+            try:
+                generated_article = render_stream(
+                    stream_article_for_dashboard(
+                        title_api, 
+                        selected_news['source'], 
+                        selected_news['url'], 
+                        selected_news['date'], 
+                        content,
+                        matched_keywords=matched_keywords
+                    ),
+                    article_placeholder.markdown
+                ).strip()
+            except requests.exceptions.RequestException:
+                generated_article = ''
+
+        if generated_article:
+            # Kept for this session so the article survives reruns; the response cache
+            # answers a repeated request for the same news without calling the API
+            generated_articles[news_id] = generated_article
             st.success("مقاله با موفقیت تولید و ذخیره شد.")
         else:
+            article_placeholder.empty()
             st.error("خطا در تولید مقاله")
+    elif news_id in generated_articles:
+        with st.expander("🔍 مشاهده مقاله تولید شده (برای بستن کلیک کنید)"):
+            st.write(generated_articles[news_id])
 
     st.markdown("### لینک اصلی")
     st.write(selected_news['url'])
 
     # Section for images
     st.markdown("### تصاویر")
-    images = db_manager.load_images(news_id)
-
-    if images:
-        for img in images:
-            st.image(img, use_column_width=True)
+    image_refs = details['image_refs']
+
+    if image_refs:
+        image_cache = get_image_cache()
+        for image_id, image_hash in image_refs:
+            # Images without a hash (stored before it existed) are cached under their row id
+            cache_key = image_hash or f"id:{image_id}"
+            load_data = lambda image_id=image_id: db_manager.load_image_data(image_id)
+            thumbnail = image_cache.thumbnail(cache_key, load_data)
+            if thumbnail is None:
+                continue
+            st.image(thumbnail, use_column_width=True)
+            if st.button("نمایش تصویر با اندازه کامل", key=f"full_image_{image_id}"):
+                st.image(image_cache.original(cache_key, load_data), use_column_width=True)
     else:
         st.write("عکسی برای این مقاله یافت نشد.")
     
@@ -435,7 +480,7 @@ def news_details_page():
 
     # Section for tags
     st.markdown("### برچسب‌ها")
-    tags_df = db_manager.load_tags(news_id)
+    tags_df = details['tags']
     if not tags_df.empty:
         st.write(' ,'.join(tags_df['tag']))
     else:
@@ -445,7 +490,7 @@ def news_details_page():
 
             generated_tags = generate_tags_for_dashboard(content, selected_news.get('tags', []))
             if generated_tags:
-                db_manager.insert_content_tags(news_id, generated_tags)
+                db_manager.insert_content_tags(news_id, db_manager.insert_tags(generated_tags))
                 st.success("تولید تگ با موفقیت انجام شد.")
                 st.experimental_rerun()
             else:
@@ -456,18 +501,25 @@ def news_details_page():
 def statistics_page():
     st.title("آمار اخبار")
 
-    last_week_data = news_data[news_data['date'] >= (datetime.now() - timedelta(days=7))]
+    today = datetime.now().date()
+    start_date = st.date_input("تاریخ شروع", value=today - timedelta(days=30))
+    end_date = st.date_input("تاریخ پایان", value=today)
+    last_week_start = today - timedelta(days=7)
+
+    # Both charts read the daily rollup, never the articles themselves, and only the days they show
+    stats = db_manager.load_daily_stats(start_day=min(start_date, last_week_start), end_day=max(end_date, today))
+    daily_stats = stats[(stats['day'] >= pd.Timestamp(start_date)) & (stats['day'] <= pd.Timestamp(end_date))]
+    last_week_stats = stats[stats['day'] >= pd.Timestamp(last_week_start)]
 
     # Number of news from each source in the last week
-    source_count = last_week_data['source'].value_counts().reset_index()
+    source_count = last_week_stats.groupby('source')['count'].sum().sort_values(ascending=False).reset_index()
     source_count.columns = ['منبع', 'تعداد اخبار']
     fig1 = px.bar(source_count, x='منبع', y='تعداد اخبار', title="تعداد اخبار از هر منبع (هفته گذشته)", color='منبع', template='plotly_dark')
     st.plotly_chart(fig1, use_container_width=True)
 
     # Number of news per day
-    daily_count = news_data['date'].dt.date.value_counts().reset_index()
+    daily_count = daily_stats.groupby('day')['count'].sum().reset_index()
     daily_count.columns = ['تاریخ', 'تعداد اخبار']
-    daily_count = daily_count.sort_values(by='تاریخ')
     fig2 = px.line(daily_count, x='تاریخ', y='تعداد اخبار', title="تعداد اخبار در هر روز", markers=True, template='plotly_dark')
     st.plotly_chart(fig2, use_container_width=True)
     
@@ -1,15 +1,361 @@
 import pyodbc
 import os
+import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import pandas as pd
-import streamlit as st
-import requests
 from PIL import Image
+from cachetools import LRUCache
 import io
+import pickle
+from migrations import apply_migrations, DAILY_STATS_REBUILD_SQL, DUPLICATE_URLS_MERGE_SQL
+from url_filter import BloomFilter
+from search_index import SearchIndex
+from enrichment import enrich
+from frame_types import compact_content_frame
+from image_downloader import get_downloader
+from blob_store import get_blob_store
 
 load_dotenv()
 
+# Columns needed to list and filter articles. The NVARCHAR(MAX) bodies are left out
+# and fetched per article with load_content_details. domain and snippet are stored at
+# ingest time; the snippet expression only covers rows not backfilled yet.
+CONTENT_LIST_COLUMNS = """
+    id, title, title_persian, date, url, author, views, source, final_score, type, domain, word_count,
+    COALESCE(snippet, LEFT(COALESCE(NULLIF(summary_persian, ''), summary, ''), 200)) AS snippet
+"""
+
+# Row version as a number, loaded with the list projection for incremental refreshes.
+# Rows at or above MIN_ACTIVE_ROWVERSION() may belong to open transactions, so
+# CONTENT_VERSION_VISIBLE leaves them for the next refresh instead of skipping past them.
+CONTENT_VERSION_COLUMN = "CAST(row_version AS BIGINT) AS row_version"
+CONTENT_VERSION_VISIBLE = "row_version < MIN_ACTIVE_ROWVERSION()"
+
+# Sort keys accepted by query_content. Nullable columns are coalesced so that keyset
+# comparisons on (sort value, id) never see NULL, except those in CONTENT_NULLABLE_SORT_KEYS.
+CONTENT_SORT_EXPRESSIONS = {
+    'date': "date",
+    'title': "COALESCE(title_persian, N'')",
+    'source': "COALESCE(source, N'')",
+    'final_score': "COALESCE(final_score, 0)",
+}
+# Sorted without COALESCE so their index keeps serving the order; rows where they are NULL
+# are listed after all others, by id (see query_content)
+CONTENT_NULLABLE_SORT_KEYS = {'date'}
+# Placeholder for a cursor's sort value. pyodbc binds datetimes as datetime2, which compares
+# unequal to the DATETIME it was read from (.003 vs .0033333), so ties at a page boundary break.
+CONTENT_SORT_PLACEHOLDERS = {'date': "CAST(? AS DATETIME)"}
+
+# Columns staged for bulk inserts into Content: (name, SQL type, pyodbc input size).
+# Input sizes are fixed up front because fast_executemany cannot infer NVARCHAR(MAX).
+# Strings use the database collation, not tempdb's, so the MERGE on url can compare them.
+CONTENT_STAGING_COLUMNS = [
+    ('title', 'NVARCHAR(255) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 255, 0)),
+    ('title_persian', 'NVARCHAR(255) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 255, 0)),
+    ('date', 'DATETIME', (pyodbc.SQL_TYPE_TIMESTAMP, 23, 3)),
+    ('content', 'NVARCHAR(MAX) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 0, 0)),
+    ('content_persian', 'NVARCHAR(MAX) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 0, 0)),
+    ('url', 'NVARCHAR(500) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 500, 0)),
+    ('author', 'NVARCHAR(255) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 255, 0)),
+    ('views', 'INT', (pyodbc.SQL_INTEGER, 0, 0)),
+    ('source', 'NVARCHAR(255) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 255, 0)),
+    ('summary', 'NVARCHAR(MAX) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 0, 0)),
+    ('summary_persian', 'NVARCHAR(MAX) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 0, 0)),
+    ('final_score', 'FLOAT', (pyodbc.SQL_DOUBLE, 0, 0)),
+    ('type', 'NVARCHAR(100) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 100, 0)),
+    ('content_text', 'NVARCHAR(MAX) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 0, 0)),
+    ('domain', 'NVARCHAR(255) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 255, 0)),
+    ('snippet', 'NVARCHAR(400) COLLATE DATABASE_DEFAULT', (pyodbc.SQL_WVARCHAR, 400, 0)),
+    ('word_count', 'INT', (pyodbc.SQL_INTEGER, 0, 0)),
+]
+CONTENT_BACKFILL_BATCH_SIZE = int(os.getenv("CONTENT_BACKFILL_BATCH_SIZE", "500"))
+CONTENT_INSERT_BATCH_SIZE = int(os.getenv("CONTENT_INSERT_BATCH_SIZE", "500"))
+
+
+class TagCache:
+    """Process-wide tag -> id mapping, loaded from Tags on first use and extended after writes."""
+
+    def __init__(self):
+        self._ids = {}
+        self._warm = False
+        self._lock = threading.Lock()
+
+    def warm(self, cursor):
+        with self._lock:
+            if self._warm:
+                return
+        rows = cursor.execute("SELECT tag, id FROM Tags").fetchall()
+        with self._lock:
+            self._ids.update({row[0]: int(row[1]) for row in rows})
+            self._warm = True
+        logging.warning(f"Loaded {len(rows)} tags into the tag cache.")
+
+    def lookup(self, tags):
+        """Return ({tag: id} for cached tags, [tags not in the cache])."""
+        found = {}
+        missing = []
+        with self._lock:
+            for tag in set(tags):
+                if tag in self._ids:
+                    found[tag] = self._ids[tag]
+                else:
+                    missing.append(tag)
+        return found, missing
+
+    def update(self, tag_ids):
+        with self._lock:
+            self._ids.update(tag_ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._warm = False
+
+
+_tag_cache = TagCache()
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+# Bloom filter of stored URLs, persisted between runs so crawls skip known URLs locally
+URL_BLOOM_PATH = os.getenv("URL_BLOOM_PATH", os.path.join(CACHE_DIR, "url_bloom.bin"))
+URL_BLOOM_ERROR_RATE = float(os.getenv("URL_BLOOM_ERROR_RATE", "0.01"))
+_url_bloom = None
+_url_bloom_lock = threading.Lock()
+
+# Inverted index over titles and bodies. Built and saved by the ingest path
+# (insert_content_items); the dashboard loads the saved copy and tops it up in the background.
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(CACHE_DIR, "search_index.pkl"))
+SEARCH_INDEX_REFRESH_SECONDS = int(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "60"))
+SEARCH_INDEXED_COLUMNS = ['title', 'title_persian', 'content', 'content_persian']
+_search_index = None
+# Guards the index contents; held only while adding or searching, never across queries
+_search_index_lock = threading.Lock()
+# Serializes top-ups, so two threads never read the same rows
+_search_index_update_lock = threading.Lock()
+_search_index_thread = None
+_search_index_thread_lock = threading.Lock()
+
+
+def _image_content_type(image_data):
+    """Return the MIME type of encoded image bytes from their header, or None."""
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            return Image.MIME.get(image.format)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _remember_url(url):
+    """Add a freshly inserted URL to the loaded URL filter, if any."""
+    with _url_bloom_lock:
+        if _url_bloom is not None:
+            _url_bloom.add(url)
+
+
+def _index_content(content_id, *texts):
+    """Add new or changed text to the loaded search index, if any."""
+    with _search_index_lock:
+        if _search_index is not None:
+            _search_index.add(content_id, *texts)
+
+
+def _loaded_search_index():
+    """Return the process-wide search index, loading the saved copy on first use."""
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            try:
+                _search_index = SearchIndex.load(SEARCH_INDEX_PATH)
+            except FileNotFoundError:
+                _search_index = SearchIndex()
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+                logging.error(f"Ignoring unreadable search index {SEARCH_INDEX_PATH}: {e}")
+                _search_index = SearchIndex()
+        return _search_index
+
+
+CONTENT_BODY_CACHE_SIZE = int(os.getenv("CONTENT_BODY_CACHE_SIZE", "64"))
+_content_body_cache = LRUCache(maxsize=CONTENT_BODY_CACHE_SIZE)
+_content_body_cache_lock = threading.Lock()
+
+
+def _like_escape(value):
+    """Escape LIKE wildcards so user input is matched literally."""
+    return value.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+
+
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _to_sql_param(value):
+    """Convert pandas/numpy scalars to plain Python values pyodbc can bind; NaT/NaN become None."""
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "30"))
+
+
+class ConnectionPool:
+    """Thread-safe pool of pyodbc connections shared by every DatabaseManager in the process.
+
+    At most max_size connections are open at once. Connections idle for longer than
+    idle_timeout are closed, and a connection is only pinged with SELECT 1 on checkout
+    when it has been idle for longer than health_check_after.
+    """
+
+    def __init__(self, connection_string, max_size=DB_POOL_SIZE, idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                 health_check_after=DB_POOL_HEALTH_CHECK_AFTER, checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self._idle = []  # (connection, returned_at), most recently returned last
+        self._open = 0
+        self._closed = False
+        self._available = threading.Condition(threading.Lock())
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise pyodbc.InterfaceError("Connection pool is closed.")
+                self._evict_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise pyodbc.OperationalError("Timed out waiting for a database connection from the pool.")
+                self._available.wait(remaining)
+
+        # Connect and health-check outside the lock so other threads are not blocked
+        if conn is not None and time.monotonic() - returned_at > self.health_check_after:
+            if not self._is_alive(conn):
+                logging.warning("Discarding stale pooled database connection.")
+                self._close_quietly(conn)
+                conn = None
+        if conn is None:
+            try:
+                conn = pyodbc.connect(self.connection_string)
+            except pyodbc.Error:
+                self._forget()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            conn.rollback()
+        except pyodbc.Error:
+            self._close_quietly(conn)
+            self._forget()
+            return
+        with self._available:
+            if self._closed:
+                self._close_quietly(conn)
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def close(self):
+        """Close idle connections and refuse further checkouts; borrowed ones close on return."""
+        with self._available:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._open -= len(self._idle)
+            self._idle = []
+            self._available.notify_all()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        keep = []
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.idle_timeout:
+                self._close_quietly(conn)
+                self._open -= 1
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+
+    def _forget(self):
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            conn.cursor().execute("SELECT 1").fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(connection_string):
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = ConnectionPool(connection_string)
+        return _pool
+
+
+def close_pool():
+    """Close the process-wide connection pool, e.g. before a script exits.
+
+    Every DatabaseManager shares it, so only call this once none of them is in use.
+    A later connect() creates a new pool.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        logging.warning("Database connection pool closed.")
+
+
 class DatabaseManager:
     def __init__(self):
         self.server = os.getenv("DB_SERVER")
@@ -20,86 +366,389 @@ class DatabaseManager:
         # self.database = st.secrets.get("DB_NAME")
         # self.username = st.secrets.get("DB_USERNAME")
         # self.password = st.secrets.get("DB_PASSWORD")
-        self.conn = None
-        self.cursor = None
+        self.pool = None
+
+    def connection_string(self):
+        return (
+            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+            f"SERVER={self.server};"
+            f"DATABASE={self.database};"
+            f"UID={self.username};"
+            f"PWD={self.password};"
+            f"Timeout=30;"
+        )
 
     def connect(self):
-        """Establish a connection to the SQL Server database."""
-        try:
-            logging.warning(self.server)
-            logging.warning(f"DRIVER={{ODBC Driver 17 for SQL Server}};" + \
-                f"SERVER={self.server};" + \
-                f"DATABASE={self.database};" + \
-                f"UID={self.username};"+ \
-                f"PWD={self.password}")
-            self.conn = pyodbc.connect(
-                f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                f"SERVER={self.server};"
-                f"DATABASE={self.database};"
-                f"UID={self.username};"
-                f"PWD={self.password};"
-                f"Timeout=30;"
-            )
-            self.cursor = self.conn.cursor()
-            logging.warning("Database connection established.")
-        except pyodbc.Error as e:
-            logging.error(f"Error connecting to SQL Server: {e}")
+        """Attach to the shared connection pool. Connections are opened lazily on checkout."""
+        self.pool = get_pool(self.connection_string())
+        logging.warning(f"Using database connection pool for {self.server}/{self.database}.")
 
     def close(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
-            logging.warning("Database connection closed.")
-            
-    def load_content_data(self):
-        """Load all content data from the database."""
-        query = """
-        SELECT id, title, title_persian, date, content, content_persian, url, author, views, source, 
-               summary, summary_persian, final_score, type
+        """Detach from the shared connection pool, leaving it open for other instances.
+        Use close_pool() to shut the pool down."""
+        self.pool = None
+
+    def connection(self):
+        """Borrow a pooled connection: `with db_manager.connection() as conn: ...`."""
+        if self.pool is None:
+            self.connect()
+        return self.pool.connection()
+
+    def load_content_data(self, since_version=None, compact=False):
+        """Load the list projection of content with its row_version, optionally only rows
+        inserted or updated after since_version.
+
+        Rows written by transactions still open are left out (see CONTENT_VERSION_VISIBLE),
+        so the highest row_version returned is a safe high-water mark for the next call.
+        With compact=True the frame uses categorical, Arrow string and downcast numeric
+        dtypes (see frame_types.compact_content_frame).
+        """
+        where = f"WHERE {CONTENT_VERSION_VISIBLE}"
+        params = None
+        if since_version is not None:
+            where += " AND row_version > CAST(CAST(? AS BIGINT) AS BINARY(8))"
+            params = [int(since_version)]
+        query = f"""
+        SELECT {CONTENT_LIST_COLUMNS}, {CONTENT_VERSION_COLUMN}
         FROM Content
+        {where}
         ORDER BY date DESC
         """
         try:
-            df = pd.read_sql(query, self.conn)
-            logging.warning("Loaded content data from the database.")
-            return df
+            with self.connection() as conn:
+                df = pd.read_sql(query, conn, params=params)
+            logging.warning(f"Loaded {len(df)} content rows from the database.")
+            return compact_content_frame(df) if compact else df
         except pyodbc.Error as e:
             logging.error(f"Error loading content data: {e}")
             return pd.DataFrame()
 
+    def content_count(self, max_id):
+        """Return the number of rows with id <= max_id, or None on error.
 
-    # def load_images(self, news_id):
-    #     """Load images for a given news item (image data stored as binary)."""
-    #     sql = "SELECT image_data FROM ContentImages WHERE content_id = ?"
-    #     try:
-    #         # df = pd.read_sql(query, self.conn, params=[content_id])
-    #         self.cursor.execute(sql, (news_id,))
-    #         rows = self.cursor.fetchall()
-    #         images_df = pd.DataFrame(rows, columns=['image_data'])
-    #         return images_df
-    #     except pyodbc.Error as e:
-    #         logging.error(f"Error loading images: {e}")
-    #         return pd.DataFrame()
-
+        Row versions reveal inserts and updates but not deletes; a saved snapshot holding
+        more of these rows than the table has is stale.
+        """
+        try:
+            with self.connection() as conn:
+                return int(conn.cursor().execute("SELECT COUNT_BIG(*) FROM Content WHERE id <= ?", (int(max_id),)).fetchone()[0])
+        except pyodbc.Error as e:
+            logging.error(f"Error counting content rows: {e}")
+            return None
 
-    def load_images(self, news_id):
-        """Load images for a given news item (image data stored as binary)."""
-        sql = "SELECT image_data FROM ContentImages WHERE content_id = ?"
+    def load_content_rows(self, ids):
+        """Reload the list projection of specific rows by id, e.g. after they were updated in place."""
+        ids = [int(content_id) for content_id in ids]
+        if not ids:
+            return pd.DataFrame()
+        placeholders = ", ".join("?" for _ in ids)
+        query = f"""
+        SELECT {CONTENT_LIST_COLUMNS}, {CONTENT_VERSION_COLUMN}
+        FROM Content
+        WHERE id IN ({placeholders})
+        """
         try:
-            self.cursor.execute(sql, (news_id,))
-            rows = self.cursor.fetchall()
-            if rows:
-                # Convert each row's binary image data back into a usable image format
-                images = [Image.open(io.BytesIO(row[0])) for row in rows]
-                return images
+            with self.connection() as conn:
+                return pd.read_sql(query, conn, params=ids)
+        except pyodbc.Error as e:
+            logging.error(f"Error reloading content rows {ids}: {e}")
+            return pd.DataFrame()
+
+    def _content_filter_conditions(self, filters):
+        """Build parameterized WHERE conditions for the news list filters.
+
+        Supported keys: sources (list), type, domain, title, start_date, end_date (inclusive
+        dates) and ids (restrict to these ids).
+        """
+        filters = filters or {}
+        conditions = []
+        params = []
+
+        if filters.get('sources'):
+            sources = list(filters['sources'])
+            conditions.append(f"source IN ({', '.join('?' for _ in sources)})")
+            params.extend(sources)
+        if filters.get('type'):
+            conditions.append("type = ?")
+            params.append(filters['type'])
+        if filters.get('domain'):
+            # Rows not backfilled yet have no stored domain: match the registered domain
+            # itself and any of its subdomains in the URL instead
+            domain = _like_escape(filters['domain'])
+            conditions.append("(domain = ? OR (domain IS NULL AND (url LIKE ? OR url LIKE ? OR url LIKE ? OR url LIKE ?)))")
+            params.extend([filters['domain'], f"%://{domain}/%", f"%.{domain}/%", f"%://{domain}", f"%.{domain}"])
+        if filters.get('title'):
+            pattern = f"%{_like_escape(filters['title'])}%"
+            conditions.append("(title_persian LIKE ? OR title LIKE ?)")
+            params.extend([pattern, pattern])
+        if filters.get('start_date'):
+            conditions.append("date >= ?")
+            params.append(pd.to_datetime(filters['start_date']).to_pydatetime())
+        if filters.get('end_date'):
+            conditions.append("date < ?")
+            params.append((pd.to_datetime(filters['end_date']) + pd.Timedelta(days=1)).to_pydatetime())
+        if filters.get('ids') is not None:
+            # One JSON parameter instead of one placeholder per id (SQL Server caps those at 2100)
+            conditions.append("id IN (SELECT CAST(value AS INT) FROM OPENJSON(?))")
+            params.append(json.dumps([int(content_id) for content_id in filters['ids']]))
+
+        return conditions, params
+
+    def query_content(self, filters=None, sort=('date', 'desc'), page_size=20, cursor=None):
+        """Return one page of the news list and the cursor for the next page.
+
+        Filtering, sorting and paging run in SQL. Paging is keyset based on (sort column, id):
+        cursor is the (sort value, id) pair of the last row of the previous page, or None for
+        the first page. The returned cursor is None when there are no more rows.
+
+        For CONTENT_NULLABLE_SORT_KEYS the rows with a value come first, then the rows
+        without one by id, in the same direction; their cursors carry None as sort value.
+        Each part is read with its own keyset query, so both stay index seeks.
+        """
+        if filters and filters.get('ids') is not None and len(filters['ids']) == 0:
+            return pd.DataFrame(), None
+
+        sort_key, direction = sort
+        sort_expr = CONTENT_SORT_EXPRESSIONS[sort_key]
+        direction = "ASC" if direction.lower() == "asc" else "DESC"
+        comparison = ">" if direction == "ASC" else "<"
+        placeholder = CONTENT_SORT_PLACEHOLDERS.get(sort_key, "?")
+        sort_value, last_id = (None, None) if cursor is None else (_to_sql_param(cursor[0]), int(cursor[1]))
+
+        filter_conditions, filter_params = self._content_filter_conditions(filters)
+        # (extra conditions, their params) of each part, read in order until the page is full
+        parts = []
+        if sort_key not in CONTENT_NULLABLE_SORT_KEYS or cursor is None or sort_value is not None:
+            conditions = [] if sort_key not in CONTENT_NULLABLE_SORT_KEYS else [f"{sort_expr} IS NOT NULL"]
+            params = []
+            if cursor is not None:
+                conditions.append(f"({sort_expr} {comparison} {placeholder} OR ({sort_expr} = {placeholder} AND id {comparison} ?))")
+                params.extend([sort_value, sort_value, last_id])
+            parts.append((conditions, params))
+        if sort_key in CONTENT_NULLABLE_SORT_KEYS:
+            if cursor is not None and sort_value is None:
+                parts.append(([f"{sort_expr} IS NULL", f"id {comparison} ?"], [last_id]))
             else:
-                return []
+                parts.append(([f"{sort_expr} IS NULL"], []))
+
+        # Fetch one extra row to know whether another page follows
+        remaining = int(page_size) + 1
+        frames = []
+        try:
+            with self.connection() as conn:
+                for conditions, params in parts:
+                    query = f"""
+                    SELECT TOP (?) {CONTENT_LIST_COLUMNS}, {sort_expr} AS sort_value
+                    FROM Content
+                    {_where(filter_conditions + conditions)}
+                    ORDER BY {sort_expr} {direction}, id {direction}
+                    """
+                    frame = pd.read_sql(query, conn, params=[remaining] + filter_params + params)
+                    frames.append(frame)
+                    remaining -= len(frame)
+                    if remaining <= 0:
+                        break
         except pyodbc.Error as e:
-            logging.error(f"Error loading images: {e}")
+            logging.error(f"Error querying content: {e}")
+            return pd.DataFrame(), None
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+        next_cursor = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            last = df.iloc[-1]
+            next_cursor = (_to_sql_param(last['sort_value']), int(last['id']))
+        return df.drop(columns=['sort_value']), next_cursor
+
+    def count_content(self, filters=None):
+        """Return the number of rows query_content pages through for these filters."""
+        if filters and filters.get('ids') is not None and len(filters['ids']) == 0:
+            return 0
+        conditions, params = self._content_filter_conditions(filters)
+        query = f"SELECT COUNT_BIG(*) FROM Content {_where(conditions)}"
+        try:
+            with self.connection() as conn:
+                return int(conn.cursor().execute(query, params).fetchone()[0])
+        except pyodbc.Error as e:
+            logging.error(f"Error counting content: {e}")
+            return 0
+
+    def query_content_ids(self, filters=None):
+        """Return the ids of all content rows matching the news list filters."""
+        conditions, params = self._content_filter_conditions(filters)
+        query = f"SELECT id FROM Content {_where(conditions)}"
+        try:
+            with self.connection() as conn:
+                rows = conn.cursor().execute(query, params).fetchall()
+            return [row.id for row in rows]
+        except pyodbc.Error as e:
+            logging.error(f"Error querying content ids: {e}")
             return []
 
+    def load_content_details(self, content_id):
+        """Load what the details page shows for one item (body, tags, image references)
+        by content id in a single round trip. Returns None when the item does not exist.
+
+        The body comes from a small LRU cache when present.
+        """
+        content_id = int(content_id)
+        with _content_body_cache_lock:
+            body = _content_body_cache.get(content_id)
+        statements = [
+            "SELECT t.tag FROM ContentTags ct JOIN Tags t ON ct.tag_id = t.id WHERE ct.content_id = ?",
+            """
+            SELECT id, image_hash FROM ContentImages
+            WHERE content_id = ? AND (image_hash IS NOT NULL OR image_data IS NOT NULL)
+            ORDER BY id
+            """,
+        ]
+        if body is None:
+            statements.append("SELECT content, content_persian, summary, summary_persian FROM Content WHERE id = ?")
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SET NOCOUNT ON; " + "; ".join(statements), [content_id] * len(statements))
+                tag_rows = cursor.fetchall()
+                cursor.nextset()
+                image_rows = cursor.fetchall()
+                if body is None:
+                    cursor.nextset()
+                    row = cursor.fetchone()
+                    if row is None:
+                        return None
+                    body = {
+                        'content': row.content,
+                        'content_persian': row.content_persian,
+                        'summary': row.summary,
+                        'summary_persian': row.summary_persian,
+                    }
+                    with _content_body_cache_lock:
+                        _content_body_cache[content_id] = body
+        except pyodbc.Error as e:
+            logging.error(f"Error loading details for content ID {content_id}: {e}")
+            return None
+        return {
+            'body': body,
+            'tags': pd.DataFrame([tuple(row) for row in tag_rows], columns=['tag']),
+            'image_refs': [(row.id, row.image_hash) for row in image_rows],
+        }
+
+    def load_content_texts(self, ids, chunk_size=1000):
+        """Load the stored plain text of many items, with the HTML body only where it is missing."""
+        ids = [int(content_id) for content_id in ids]
+        frames = []
+        try:
+            with self.connection() as conn:
+                for start in range(0, len(ids), chunk_size):
+                    chunk = ids[start:start + chunk_size]
+                    query = f"""
+                    SELECT id, content_text, CASE WHEN content_text IS NULL THEN content END AS content
+                    FROM Content
+                    WHERE id IN ({", ".join("?" for _ in chunk)})
+                    """
+                    frames.append(pd.read_sql(query, conn, params=chunk))
+        except pyodbc.Error as e:
+            logging.error(f"Error loading content texts: {e}")
+        if not frames:
+            return pd.DataFrame(columns=['id', 'content_text', 'content'])
+        return pd.concat(frames, ignore_index=True)
+
+    def backfill_enrichment(self, batch_size=CONTENT_BACKFILL_BATCH_SIZE):
+        """Compute the stored derived columns for rows ingested before they existed.
+
+        Walks the table by id, one transaction per batch, so it can be stopped and
+        resumed. Returns the number of rows updated.
+        """
+        select_sql = """
+        SELECT TOP (?) id, url, content, summary, summary_persian
+        FROM Content
+        WHERE content_text IS NULL AND id > ?
+        ORDER BY id
+        """
+        update_sql = """
+        UPDATE Content
+        SET content_text = ?, domain = ?, snippet = ?, word_count = ?
+        WHERE id = ?
+        """
+        updated = 0
+        last_id = 0
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            while True:
+                rows = cursor.execute(select_sql, (batch_size, last_id)).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row in rows:
+                    derived = enrich(row.content, row.url, row.summary, row.summary_persian)
+                    updates.append((derived['content_text'], derived['domain'], derived['snippet'], derived['word_count'], row.id))
+                cursor.executemany(update_sql, updates)
+                conn.commit()
+                last_id = rows[-1].id
+                updated += len(updates)
+                logging.warning(f"Backfilled derived columns for {updated} content items.")
+        return updated
+
+    def load_image_data(self, image_id):
+        """Return the bytes of one image from the blob store, or from the row if not moved yet."""
+        sql = "SELECT image_hash, image_data FROM ContentImages WHERE id = ?"
+        try:
+            with self.connection() as conn:
+                row = conn.cursor().execute(sql, (image_id,)).fetchone()
+        except pyodbc.Error as e:
+            logging.error(f"Error loading image {image_id}: {e}")
+            return None
+        if row is None:
+            return None
+        if row.image_data is not None:
+            return bytes(row.image_data)
+        image_data = get_blob_store().get(row.image_hash) if row.image_hash else None
+        if image_data is None:
+            logging.error(f"Image {image_id} ({row.image_hash}) is missing from the blob store.")
+        return image_data
+
+    def move_image_blobs(self, batch_size=100):
+        """Move image bytes stored in ContentImages into the blob store, one batch per transaction.
+
+        Each row keeps its hash, size and content type; image_data is cleared only after
+        BlobStore.put has made the blob durable (fsynced), so the move can be interrupted and
+        resumed and a crash never loses the only copy. A row that cannot be stored is logged and
+        left in place. Returns rows moved.
+        """
+        select_sql = """
+        SELECT TOP (?) id, image_data FROM ContentImages
+        WHERE image_data IS NOT NULL AND id > ?
+        ORDER BY id
+        """
+        update_sql = """
+        UPDATE ContentImages
+        SET image_hash = ?, size_bytes = ?, content_type = ?, image_data = NULL
+        WHERE id = ?
+        """
+        store = get_blob_store()
+        moved = 0
+        last_id = 0
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            while True:
+                rows = cursor.execute(select_sql, (batch_size, last_id)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                updates = []
+                for row in rows:
+                    image_data = bytes(row.image_data)
+                    try:
+                        updates.append((store.put(image_data), len(image_data), _image_content_type(image_data), row.id))
+                    except OSError as e:
+                        logging.error(f"Error moving image {row.id} to the blob store: {e}")
+                if updates:
+                    cursor.executemany(update_sql, updates)
+                    conn.commit()
+                moved += len(updates)
+                logging.warning(f"Moved {moved} images to the blob store.")
+        return moved
 
-        
     def load_tags(self, content_id):
         """Load tags associated with a specific content item."""
         query = """
@@ -109,7 +758,8 @@ class DatabaseManager:
         WHERE ct.content_id = ?
         """
         try:
-            df = pd.read_sql(query, self.conn, params=[content_id])
+            with self.connection() as conn:
+                df = pd.read_sql(query, conn, params=[content_id])
             logging.warning(f"Loaded tags for content ID {content_id}.")
             return df
         except pyodbc.Error as e:
@@ -118,155 +768,206 @@ class DatabaseManager:
         
     def content_exists(self, url):
         """Check if a content item already exists in the database by its URL."""
-        self.ensure_connection() 
-        query = "SELECT COUNT(*) FROM Content WHERE url = ?"
+        return not self.filter_new_urls([url])
+
+    def filter_new_urls(self, urls):
+        """Return the URLs (deduplicated, in input order) that are not stored in Content yet.
+
+        URLs the local Bloom filter has never seen are new without asking the database; the
+        rest are checked with one set-based query. On database errors every URL is returned,
+        since inserts skip stored URLs anyway.
+        """
+        unique_urls = list(dict.fromkeys(url for url in urls if url))
+        if not unique_urls:
+            return []
+        query = """
+        SELECT j.url
+        FROM OPENJSON(?) WITH (url NVARCHAR(500) '$') AS j
+        JOIN Content c ON c.url = j.url
+        """
         try:
-            self.cursor.execute(query, (url,))
-            count = self.cursor.fetchone()[0]
-            return count > 0
+            with self.connection() as conn:
+                bloom = self._url_filter(conn)
+                maybe_known = [url for url in unique_urls if url in bloom]
+                known = set()
+                if maybe_known:
+                    rows = conn.cursor().execute(query, (json.dumps(maybe_known),)).fetchall()
+                    known = {row.url for row in rows}
         except pyodbc.Error as e:
-            logging.error(f"Error checking if content exists: {e}")
-            return False
+            logging.error(f"Error checking which URLs are new: {e}")
+            return unique_urls
+        if len(unique_urls) > 1:
+            logging.warning(f"URL check: {len(unique_urls)} URLs, {len(maybe_known)} sent to the database, {len(known)} already stored.")
+        return [url for url in unique_urls if url not in known]
+
+    def _url_filter(self, conn):
+        """Return the process-wide URL Bloom filter, topped up with rows added since it was saved."""
+        global _url_bloom
+        with _url_bloom_lock:
+            if _url_bloom is None:
+                try:
+                    _url_bloom = BloomFilter.load(URL_BLOOM_PATH)
+                except (OSError, ValueError):
+                    _url_bloom = self._new_url_filter(conn)
+            added = self._top_up_url_filter(conn, _url_bloom)
+            if _url_bloom.is_full:
+                # Past its capacity the false positive rate climbs; rebuild with more room
+                _url_bloom = self._new_url_filter(conn)
+                added = self._top_up_url_filter(conn, _url_bloom)
+            if added:
+                try:
+                    _url_bloom.save(URL_BLOOM_PATH)
+                except OSError as e:
+                    logging.error(f"Error saving URL filter to {URL_BLOOM_PATH}: {e}")
+            return _url_bloom
+
+    def _new_url_filter(self, conn):
+        count = conn.cursor().execute("SELECT COUNT(*) FROM Content").fetchone()[0]
+        return BloomFilter(capacity=max(2 * count, 100000), error_rate=URL_BLOOM_ERROR_RATE)
+
+    def _top_up_url_filter(self, conn, bloom):
+        """Add the URLs of rows above the filter's watermark. Returns the number of rows read."""
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, url FROM Content WHERE id > ? ORDER BY id", (bloom.watermark,))
+        added = 0
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                if row.url:
+                    bloom.add(row.url)
+            bloom.watermark = int(rows[-1].id)
+            added += len(rows)
+        if added:
+            logging.warning(f"Added {added} URLs to the URL filter.")
+        return added
         
-    def alter_tables_for_unicode(self):
-        """Alter tables to ensure they support Unicode characters."""
-        alter_content_table_sql = """
-        IF OBJECT_ID('Content', 'U') IS NOT NULL
-        BEGIN
-            -- Alter columns to NVARCHAR(MAX) for Unicode support
-            IF COL_LENGTH('Content', 'content') IS NOT NULL
-            BEGIN
-                ALTER TABLE Content
-                ALTER COLUMN content NVARCHAR(MAX);
-            END
-
-            IF COL_LENGTH('Content', 'content_persian') IS NOT NULL
-            BEGIN
-                ALTER TABLE Content
-                ALTER COLUMN content_persian NVARCHAR(MAX);
-            END
-
-            IF COL_LENGTH('Content', 'summary') IS NOT NULL
-            BEGIN
-                ALTER TABLE Content
-                ALTER COLUMN summary NVARCHAR(MAX);
-            END
-
-            IF COL_LENGTH('Content', 'summary_persian') IS NOT NULL
-            BEGIN
-                ALTER TABLE Content
-                ALTER COLUMN summary_persian NVARCHAR(MAX);
-            END
-        END
+    def search_content_ids(self, query):
+        """Return the set of content ids matching a search query over titles and bodies.
+
+        Searches the index as loaded; no database query runs on this path. The first call
+        starts a background thread that keeps the index up to date. See SearchIndex.search
+        for the query syntax (AND by default, OR, prefix*).
         """
+        if not query or not query.strip():
+            return set()
+        index = _loaded_search_index()
+        self.start_search_index_refresh()
+        with _search_index_lock:
+            return index.search(query)
 
-        try:
-            self.cursor.execute(alter_content_table_sql)
-            self.conn.commit()
-            logging.warning("Tables altered to support Unicode characters.")
-        except pyodbc.Error as e:
-            logging.error(f"Error altering tables: {e}")
+    def start_search_index_refresh(self, interval=SEARCH_INDEX_REFRESH_SECONDS):
+        """Top up the loaded search index from the database every interval seconds, in a
+        daemon thread shared by the whole process. Nothing is written to disk; a warning is
+        logged when there is no saved index to start from."""
+        global _search_index_thread
+        with _search_index_thread_lock:
+            if _search_index_thread is not None and _search_index_thread.is_alive():
+                return
+            _search_index_thread = threading.Thread(
+                target=self._refresh_search_index, args=(interval,), name="search-index-refresh", daemon=True
+            )
+            _search_index_thread.start()
 
-    def create_tables(self):
-        """Create necessary tables if they don't exist, or alter them to match the current item structure."""
-        # Create or update Content table
-        create_or_alter_content_table_sql = """
-        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND type in (N'U'))
-        BEGIN
-            CREATE TABLE Content (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                title NVARCHAR(255),
-                title_persian NVARCHAR(255),
-                date DATETIME,
-                content NVARCHAR(MAX),           -- Changed from TEXT to NVARCHAR(MAX)
-                content_persian NVARCHAR(MAX),    -- Changed from TEXT to NVARCHAR(MAX)
-                url NVARCHAR(500),
-                author NVARCHAR(255),
-                views INT,
-                source NVARCHAR(255),
-                summary NVARCHAR(MAX),            -- Changed from TEXT to NVARCHAR(MAX)
-                summary_persian NVARCHAR(MAX),    -- Changed from TEXT to NVARCHAR(MAX)
-                final_score FLOAT,
-                type NVARCHAR(100)
-            );
-        END
-        ELSE
-        BEGIN
-            -- Alter table to add new columns if they don't already exist
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'title_persian')
-                ALTER TABLE Content ADD title_persian NVARCHAR(255);
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'content_persian')
-                ALTER TABLE Content ADD content_persian TEXT;
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'summary_persian')
-                ALTER TABLE Content ADD summary_persian TEXT;
-        END
-        """
+    def _refresh_search_index(self, interval):
+        if not os.path.exists(SEARCH_INDEX_PATH):
+            # The refresher never saves, so without a saved index every start indexes the whole table
+            logging.warning(
+                f"No saved search index at {SEARCH_INDEX_PATH}; indexing every content item in memory. "
+                "Run `python manage.py rebuild-search-index` on this host to save one."
+            )
+        while True:
+            try:
+                with self.connection() as conn:
+                    self._top_up_search_index(conn, _loaded_search_index(), track=False)
+            except pyodbc.Error as e:
+                logging.error(f"Error refreshing the search index: {e}")
+            time.sleep(interval)
 
-        create_images_table_sql = """
-        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[ContentImages]') AND type in (N'U'))
-        BEGIN
-            CREATE TABLE ContentImages (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                content_id INT,
-                image_url NVARCHAR(500),
-                FOREIGN KEY (content_id) REFERENCES Content(id) ON DELETE CASCADE
-            );
-        END
-        """
-        create_tags_table_sql = """
-        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[Tags]') AND type in (N'U'))
-        BEGIN
-            CREATE TABLE Tags (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                tag NVARCHAR(255) UNIQUE
-            );
-        END
-        """
+    def update_search_index(self):
+        """Index the rows inserted or updated since the saved index and persist the change.
 
-        create_content_tags_table_sql = """
-        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[ContentTags]') AND type in (N'U'))
-        BEGIN
-            CREATE TABLE ContentTags (
-                content_id INT,
-                tag_id INT,
-                PRIMARY KEY (content_id, tag_id),
-                FOREIGN KEY (content_id) REFERENCES Content(id) ON DELETE CASCADE,
-                FOREIGN KEY (tag_id) REFERENCES Tags(id) ON DELETE CASCADE
-            );
-        END
+        Called on the ingest path, so the index is built as content arrives. Errors are
+        logged: a stale index must not fail ingestion, and the next call catches up.
         """
         try:
-            self.cursor.execute(create_or_alter_content_table_sql)
-            self.cursor.execute(create_images_table_sql)
-            self.cursor.execute(create_tags_table_sql)
-            self.cursor.execute(create_content_tags_table_sql)
-            self.alter_tables_for_unicode()
-            self.conn.commit()
-            logging.warning("Tables created or verified successfully.")
+            index = _loaded_search_index()
+            with self.connection() as conn:
+                self._top_up_search_index(conn, index)
+            with _search_index_lock:
+                index.persist(SEARCH_INDEX_PATH)
         except pyodbc.Error as e:
-            logging.error(f"Error creating or altering tables: {e}")
+            logging.error(f"Error updating the search index: {e}")
+        except OSError as e:
+            logging.error(f"Error saving search index to {SEARCH_INDEX_PATH}: {e}")
+
+    def rebuild_search_index(self):
+        """Index the whole Content table from scratch, replacing the saved index."""
+        global _search_index
+        index = SearchIndex()
+        with self.connection() as conn:
+            self._top_up_search_index(conn, index)
+        with _search_index_lock:
+            index.save(SEARCH_INDEX_PATH)
+            _search_index = index
+        return len(index.postings)
+
+    def _top_up_search_index(self, conn, index, track=True):
+        """Index the rows inserted or updated after the index's row_version watermark.
+        Returns the number of rows read.
+
+        The index is only locked while each chunk is added, so searches are not held up
+        by the query. track is passed on to SearchIndex.add.
+        """
+        with _search_index_update_lock:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT id, {', '.join(SEARCH_INDEXED_COLUMNS)}, {CONTENT_VERSION_COLUMN} FROM Content "
+                f"WHERE row_version > CAST(CAST(? AS BIGINT) AS BINARY(8)) AND {CONTENT_VERSION_VISIBLE} "
+                "ORDER BY row_version",
+                (index.watermark,),
+            )
+            added = 0
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                with _search_index_lock:
+                    for row in rows:
+                        index.add(row.id, *(getattr(row, column) for column in SEARCH_INDEXED_COLUMNS), track=track)
+                    index.watermark = int(rows[-1].row_version)
+                added += len(rows)
+        if added:
+            logging.warning(f"Added {added} content items to the search index.")
+        return added
+
+    def create_tables(self):
+        """Create or upgrade the schema. Kept for existing callers; same as migrate()."""
+        return self.migrate()
+
+    def migrate(self):
+        """Apply pending schema migrations and return the versions that were applied."""
+        with self.connection() as conn:
+            return apply_migrations(conn)
 
 
 
     def ensure_connection(self):
-        """Ensure that the database connection is active, and reconnect if necessary."""
-        try:
-            self.conn.cursor().execute("SELECT 1")
-        except pyodbc.Error:
-            logging.warning("Database connection lost. Reconnecting...")
+        """Ensure that the connection pool is set up. Stale connections are replaced on checkout."""
+        if self.pool is None:
             self.connect()
 
-    def insert_content_item(self, item):
-        """Insert a content item into the database and return the inserted row's ID."""
-        self.ensure_connection()  # Ensure connection is active before inserting
-        insert_sql = """
-        INSERT INTO Content (title, title_persian, date, content, content_persian, url, author, views, source, summary, summary_persian, final_score, type)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        values = (
+    def _content_values(self, item):
+        """Staging row for one crawled item. Raises KeyError for missing required fields."""
+        date = pd.to_datetime(item['date'])
+        if pd.isna(date):
+            raise ValueError("date is empty")
+        derived = enrich(item.get('content', ''), item['url'], item.get('summary', ''), item.get('summary_persian', ''))
+        return (
             item.get('title', ''),
-            item.get('title_persian', ''), 
-            item['date'],
+            item.get('title_persian', ''),
+            date.to_pydatetime(),
             item.get('content', ''),
             item.get('content_persian', ''),
             item['url'],
@@ -274,61 +975,313 @@ class DatabaseManager:
             item.get('views', 0),
             item['source'],
             item.get('summary', ''),
-            item.get('summary_persian', ''), 
+            item.get('summary_persian', ''),
             item.get('final_score', 0),
-            item.get('type', 'News')
+            item.get('type', 'News'),
+            derived['content_text'],
+            derived['domain'],
+            derived['snippet'],
+            derived['word_count'],
         )
-        
-        try:
-            self.cursor.execute(insert_sql, values)
-            self.cursor.execute("SELECT @@IDENTITY AS ID")  # Get the newly inserted content ID
-            content_id = self.cursor.fetchone()[0]
-            self.conn.commit()
 
-            logging.warning(f"Inserted content item into database: {item['title']}, ID: {content_id}")
-            
-            # Insert tags and link them to the content
-            if 'tags' in item:
-                tag_ids = self.insert_tags(item['tags'])
-                self.insert_content_tags(content_id, tag_ids)
+    def insert_content_item(self, item):
+        """Insert a content item into the database and return the inserted row's ID."""
+        content_ids, failures = self.insert_content_items([item])
+        for _, reason in failures:
+            logging.error(f"Error inserting item into database: {item.get('url')}: {reason}")
+        if content_ids[0] is not None:
+            logging.warning(f"Inserted content item into database: {item.get('title')}, ID: {content_ids[0]}")
+        return content_ids[0]
+
+    def insert_content_items(self, items, batch_size=CONTENT_INSERT_BATCH_SIZE):
+        """Insert crawled items in batches, one transaction per batch, and link their tags.
+
+        Returns (content_ids, failures): content_ids is aligned with items and holds None for
+        items that were not inserted, failures is a list of (index, reason). Items whose URL
+        is already stored are reported as failures rather than inserted twice. Inserted
+        items are added to the saved search index (see update_search_index).
+        """
+        content_ids = [None] * len(items)
+        failures = []
+
+        rows = []
+        for index, item in enumerate(items):
+            try:
+                rows.append((index,) + self._content_values(item))
+            except (KeyError, ValueError, TypeError) as e:
+                failures.append((index, f"invalid item: {e!r}"))
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                with self.connection() as conn:
+                    inserted = self._insert_content_batch(conn, batch, items)
+            except pyodbc.Error as e:
+                # Retry the batch one item at a time to find out which items are at fault.
+                # The tag cache is dropped in case it held an id of a deleted tag.
+                logging.error(f"Error inserting batch of {len(batch)} items, retrying one by one: {e}")
+                _tag_cache.clear()
+                inserted = {}
+                for row in batch:
+                    try:
+                        with self.connection() as conn:
+                            inserted.update(self._insert_content_batch(conn, [row], items))
+                    except pyodbc.Error as item_error:
+                        failures.append((row[0], str(item_error)))
+                        inserted[row[0]] = None
+
+            for row in batch:
+                index = row[0]
+                if index not in inserted:
+                    failures.append((index, "duplicate url"))
+                elif inserted[index] is not None:
+                    content_ids[index] = inserted[index]
+                    _remember_url(items[index]['url'])
+
+        if any(content_id is not None for content_id in content_ids):
+            self.update_search_index()
+
+        logging.warning(f"Inserted {sum(content_id is not None for content_id in content_ids)} of {len(items)} content items.")
+        return content_ids, failures
+
+    def _insert_content_batch(self, conn, rows, items):
+        """Insert one batch in a single transaction and return {item index: new content id}."""
+        cursor = conn.cursor()
+        columns = [name for name, _, _ in CONTENT_STAGING_COLUMNS]
+        column_list = ", ".join(columns)
+
+        cursor.execute(f"""
+        IF OBJECT_ID('tempdb..#content_staging') IS NOT NULL DROP TABLE #content_staging;
+        CREATE TABLE #content_staging (
+            item_index INT PRIMARY KEY,
+            {", ".join(f"{name} {sql_type}" for name, sql_type, _ in CONTENT_STAGING_COLUMNS)}
+        );
+        """)
+        staging_cursor = conn.cursor()
+        staging_cursor.fast_executemany = True
+        staging_cursor.setinputsizes([(pyodbc.SQL_INTEGER, 0, 0)] + [size for _, _, size in CONTENT_STAGING_COLUMNS])
+        staging_cursor.executemany(
+            f"INSERT INTO #content_staging (item_index, {column_list}) VALUES ({', '.join('?' for _ in range(len(columns) + 1))})",
+            rows,
+        )
 
-            return content_id
+        # Items repeating a stored URL, or an earlier item of the same batch, are skipped
+        cursor.execute(f"""
+        MERGE Content AS target
+        USING (
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY url ORDER BY item_index) AS url_position
+                FROM #content_staging
+            ) AS ranked
+            WHERE url_position = 1
+        ) AS source
+        ON target.url = source.url
+        WHEN NOT MATCHED THEN
+            INSERT ({column_list})
+            VALUES ({", ".join(f"source.{name}" for name in columns)})
+        OUTPUT INSERTED.id, source.item_index;
+        """)
+        inserted = {row[1]: int(row[0]) for row in cursor.fetchall()}
+        cursor.execute("DROP TABLE #content_staging")
+        if inserted:
+            self._add_daily_stats(cursor, list(inserted.values()))
+
+        # Link tags for every inserted item in one go
+        tags_by_index = {index: items[index].get('tags') or [] for index in inserted}
+        tag_ids = self._tag_ids(cursor, {tag for tags in tags_by_index.values() for tag in tags})
+        links = {
+            (inserted[index], tag_ids[tag])
+            for index, tags in tags_by_index.items()
+            for tag in tags
+            if tag in tag_ids
+        }
+        self._link_content_tags(cursor, links)
+
+        conn.commit()
+        _tag_cache.update(tag_ids)
+        return inserted
+
+    def _add_daily_stats(self, cursor, content_ids):
+        """Add newly inserted rows to ContentDailyStats, in the caller's transaction."""
+        cursor.execute("""
+        MERGE ContentDailyStats WITH (HOLDLOCK) AS target
+        USING (
+            SELECT CAST(c.date AS DATE) AS day, COALESCE(c.source, N'') AS source, COALESCE(c.type, N'') AS type,
+                   COUNT(*) AS count, COALESCE(SUM(CAST(c.views AS BIGINT)), 0) AS total_views,
+                   COALESCE(SUM(c.final_score), 0) AS score_sum, COUNT(c.final_score) AS score_count
+            FROM Content c
+            JOIN OPENJSON(?) WITH (id INT '$') AS j ON j.id = c.id
+            WHERE c.date IS NOT NULL
+            GROUP BY CAST(c.date AS DATE), COALESCE(c.source, N''), COALESCE(c.type, N'')
+        ) AS source
+        ON target.day = source.day AND target.source = source.source AND target.type = source.type
+        WHEN MATCHED THEN
+            UPDATE SET count = target.count + source.count,
+                       total_views = target.total_views + source.total_views,
+                       score_sum = target.score_sum + source.score_sum,
+                       score_count = target.score_count + source.score_count
+        WHEN NOT MATCHED THEN
+            INSERT (day, source, type, count, total_views, score_sum, score_count)
+            VALUES (source.day, source.source, source.type, source.count, source.total_views, source.score_sum, source.score_count);
+        """, (json.dumps(content_ids),))
+
+    def load_daily_stats(self, start_day=None, end_day=None):
+        """Load the daily rollup between start_day and end_day (inclusive): one row per (day, source, type)
+        with count, total_views and avg_score.
+
+        total_views holds the views each row had when it was inserted; views updated in place
+        afterwards show up only once `python manage.py rebuild-stats` has been run."""
+        conditions = []
+        params = []
+        if start_day is not None:
+            conditions.append("day >= ?")
+            params.append(pd.to_datetime(start_day).date())
+        if end_day is not None:
+            conditions.append("day <= ?")
+            params.append(pd.to_datetime(end_day).date())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params = params or None
+        query = f"""
+        SELECT day, NULLIF(source, N'') AS source, NULLIF(type, N'') AS type, count, total_views,
+               score_sum / NULLIF(score_count, 0) AS avg_score
+        FROM ContentDailyStats
+        {where}
+        ORDER BY day
+        """
+        try:
+            with self.connection() as conn:
+                df = pd.read_sql(query, conn, params=params)
+            df['day'] = pd.to_datetime(df['day'])
+            return df
         except pyodbc.Error as e:
-            print(item)
-            logging.error(f"Error inserting item into database: {e}")
-            return None
+            logging.error(f"Error loading daily statistics: {e}")
+            return pd.DataFrame(columns=['day', 'source', 'type', 'count', 'total_views', 'avg_score'])
+
+    def rebuild_daily_stats(self):
+        """Recompute ContentDailyStats from Content in one transaction. Returns the number of rollup rows."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(DAILY_STATS_REBUILD_SQL)
+            conn.commit()
+            return cursor.execute("SELECT COUNT(*) FROM ContentDailyStats").fetchone()[0]
+
+    def merge_duplicate_urls(self):
+        """Merge Content rows sharing a URL into the oldest one, in one transaction.
+
+        Tags, images and missing translations of the copies are moved to the kept row
+        before the copies are deleted. Returns the number of rows deleted.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(DUPLICATE_URLS_MERGE_SQL[0])
+                merged = cursor.execute("SELECT COUNT(*) FROM #duplicate_content").fetchone()[0]
+                for statement in DUPLICATE_URLS_MERGE_SQL[1:]:
+                    cursor.execute(statement)
+                conn.commit()
+            except pyodbc.Error as e:
+                conn.rollback()
+                logging.error(f"Error merging duplicate URLs: {e}")
+                raise
+        logging.warning(f"Merged {merged} duplicate content rows.")
+        return merged
+
+    def _tag_ids(self, cursor, tags):
+        """Return {tag: id} for the given tags, inserting missing ones. Does not commit.
+
+        Known tags come from the process-wide tag cache; all misses are upserted with one
+        MERGE. Callers add the result to the cache once their transaction has committed.
+        """
+        _tag_cache.warm(cursor)
+        tag_ids, missing = _tag_cache.lookup(tags)
+        if not missing:
+            return tag_ids
+
+        cursor.execute("""
+        IF OBJECT_ID('tempdb..#tag_staging') IS NOT NULL DROP TABLE #tag_staging;
+        CREATE TABLE #tag_staging (tag NVARCHAR(255) COLLATE DATABASE_DEFAULT);
+        """)
+        staging_cursor = cursor.connection.cursor()
+        staging_cursor.fast_executemany = True
+        staging_cursor.setinputsizes([(pyodbc.SQL_WVARCHAR, 255, 0)])
+        staging_cursor.executemany("INSERT INTO #tag_staging (tag) VALUES (?)", [(tag,) for tag in missing])
+
+        cursor.execute("""
+        MERGE Tags AS target
+        USING (SELECT DISTINCT tag FROM #tag_staging) AS source
+        ON target.tag = source.tag
+        WHEN NOT MATCHED THEN
+            INSERT (tag) VALUES (source.tag);
+        """)
+        rows = cursor.execute("SELECT s.tag, t.id FROM #tag_staging s JOIN Tags t ON t.tag = s.tag").fetchall()
+        cursor.execute("DROP TABLE #tag_staging")
+
+        tag_ids.update({row[0]: int(row[1]) for row in rows})
+        return tag_ids
+
+    def _link_content_tags(self, cursor, links):
+        """Insert (content_id, tag_id) pairs into ContentTags, skipping existing ones. Does not commit."""
+        links = list(links)
+        if not links:
+            return
+        cursor.fast_executemany = True
+        cursor.executemany("""
+        INSERT INTO ContentTags (content_id, tag_id)
+        SELECT ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM ContentTags WHERE content_id = ? AND tag_id = ?)
+        """, [(content_id, tag_id, content_id, tag_id) for content_id, tag_id in links])
+        cursor.fast_executemany = False
 
     def download_image_as_binary(self, image_url):
-        try:
-            response = requests.get(image_url)
-            response.raise_for_status()
-            return response.content 
-        except requests.RequestException as e:
-            logging.error(f"Error downloading image: {e}")
-            return None
+        return get_downloader().download_many([image_url])[0]
 
     def insert_images(self, content_id, images):
-        """Insert multiple images for a given content item, storing the image as binary data."""
+        """Insert multiple images for a given content item, storing the image in the blob store.
+
+        All images are downloaded concurrently before a connection is borrowed, then written
+        in one batched insert. Rows hold only the blob hash and metadata.
+        """
         sql = """
-        INSERT INTO ContentImages (content_id, image_data)
-        VALUES (?, ?)
+        INSERT INTO ContentImages (content_id, image_url, image_hash, size_bytes, content_type)
+        VALUES (?, ?, ?, ?, ?)
         """
+        images = list(images)
+        downloads = get_downloader().download_many(images)
+        store = get_blob_store()
         try:
-            for image_url in images:
-                image_binary = self.download_image_as_binary(image_url)
-                if image_binary:  # Ensure valid binary data is available
-                    self.cursor.execute(sql, (content_id, image_binary))
-            self.conn.commit()
-            logging.warning(f"Inserted {len(images)} images for content item ID {content_id}.")
+            rows = [
+                (content_id, image_url, store.put(image_binary), len(image_binary), _image_content_type(image_binary))
+                for image_url, image_binary in zip(images, downloads) if image_binary
+            ]
+        except OSError as e:
+            logging.error(f"Error writing images to the blob store: {e}")
+            return 0
+        if not rows:
+            logging.warning(f"No images downloaded for content item ID {content_id}.")
+            return 0
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.fast_executemany = True
+                cursor.setinputsizes([
+                    (pyodbc.SQL_INTEGER, 0, 0),
+                    (pyodbc.SQL_WVARCHAR, 500, 0),
+                    (pyodbc.SQL_CHAR, 64, 0),
+                    (pyodbc.SQL_INTEGER, 0, 0),
+                    (pyodbc.SQL_WVARCHAR, 100, 0),
+                ])
+                cursor.executemany(sql, rows)
+                conn.commit()
+            logging.warning(f"Inserted {len(rows)} of {len(images)} images for content item ID {content_id}.")
+            return len(rows)
         except pyodbc.Error as e:
             logging.error(f"Error inserting images into the database: {e}")
+            return 0
 
 
             
     def insert_translation(self, content_id, translation):
         """Insert or update the Persian translation for a given content item."""
-        self.ensure_connection()
-
         update_sql = """
         UPDATE Content
         SET content_persian = ?
@@ -336,8 +1289,12 @@ class DatabaseManager:
         """
         
         try:
-            self.cursor.execute(update_sql, (translation, content_id))
-            self.conn.commit()
+            with self.connection() as conn:
+                conn.cursor().execute(update_sql, (translation, content_id))
+                conn.commit()
+            with _content_body_cache_lock:
+                _content_body_cache.pop(int(content_id), None)
+            _index_content(content_id, translation)
             logging.warning(f"Inserted/updated Persian translation for content ID {content_id}.")
         except pyodbc.Error as e:
             logging.error(f"Error inserting translation for content ID {content_id}: {e}")
@@ -346,43 +1303,23 @@ class DatabaseManager:
             
     def insert_tags(self, tags):
         """Insert tags into the Tags table and return their IDs."""
-        tag_ids = []
-        for tag in tags:
-            select_sql = "SELECT id FROM Tags WHERE tag = ?"
-            insert_sql = "INSERT INTO Tags (tag) VALUES (?)"
-
-            try:
-                self.cursor.execute(select_sql, (tag,))
-                row = self.cursor.fetchone()
-
-                if row:
-                    tag_ids.append(row[0])
-                else:
-                    self.cursor.execute(insert_sql, (tag,))
-                    self.cursor.execute("SELECT @@IDENTITY AS ID")
-                    new_tag_id = self.cursor.fetchone()[0]
-                    tag_ids.append(new_tag_id)
-
-            except pyodbc.Error as e:
-                logging.error(f"Error inserting tag '{tag}': {e}")
-        
-        return tag_ids
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                tag_ids = self._tag_ids(cursor, tags)
+                conn.commit()
+            _tag_cache.update(tag_ids)
+            return [tag_ids[tag] for tag in tags if tag in tag_ids]
+        except pyodbc.Error as e:
+            logging.error(f"Error inserting tags {tags}: {e}")
+            return []
     
     def insert_content_tags(self, content_id, tag_ids):
         """Link content with tags in the ContentTags table."""
-        insert_sql = "INSERT INTO ContentTags (content_id, tag_id) VALUES (?, ?)"
-        
         try:
-            for tag_id in tag_ids:
-                self.cursor.execute(insert_sql, (content_id, tag_id))
-            self.conn.commit()
+            with self.connection() as conn:
+                self._link_content_tags(conn.cursor(), {(content_id, tag_id) for tag_id in tag_ids})
+                conn.commit()
             logging.warning(f"Linked {len(tag_ids)} tags to content ID {content_id}.")
         except pyodbc.Error as e:
             logging.error(f"Error linking tags to content: {e}")
-
-
-
-
-db_manager = DatabaseManager()
-db_manager.connect()
-db_manager.create_tables()
@@ -0,0 +1,49 @@
+import os
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import tldextract
+
+DOMAIN_CACHE_SIZE = int(os.getenv("DOMAIN_CACHE_SIZE", "50000"))
+
+# Public suffix list snapshot bundled with the installed tldextract: no suffix_list_urls,
+# so nothing is fetched, and no cache_dir, so nothing is written on first use
+_extractor = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None, fallback_to_snapshot=True)
+
+
+# scheme, "//" and userinfo are optional; the hostname runs up to a port, path, query or fragment
+_HOSTNAME = r'^(?:[A-Za-z][A-Za-z0-9+.-]*:)?(?://)?(?:[^@/?#]*@)?([^:/?#]*)'
+
+
+def _hostname(url):
+    parts = urlsplit(url if '//' in url else f"//{url}")
+    return parts.hostname or ''
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def _registered_domain(hostname):
+    return _extractor(hostname).registered_domain
+
+
+def extract_domain(url):
+    """Extract domain from the URL."""
+    if not url:
+        return None
+    try:
+        hostname = _hostname(url)
+    except ValueError:
+        return None
+    return _registered_domain(hostname)
+
+
+def extract_domains(urls):
+    """Vectorized extract_domain for a Series of URLs.
+
+    Hostnames are pulled out of the whole column with one regex, and only the distinct
+    hostnames go through the suffix list.
+    """
+    hostnames = urls.str.extract(_HOSTNAME, expand=False).str.lower()
+    distinct = hostnames.dropna().unique()
+    domains = hostnames.map(dict(zip(distinct, map(_registered_domain, distinct))))
+    # Same result as extract_domain for missing or empty URLs
+    return domains.where(urls.fillna('').astype(bool), None)
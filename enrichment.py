@@ -0,0 +1,36 @@
+import re
+
+from bs4 import BeautifulSoup
+
+from domains import extract_domain
+
+SNIPPET_LENGTH = 200
+
+
+def html_to_text(content):
+    """Plain text of an HTML body, with runs of whitespace collapsed."""
+    if not content:
+        return ''
+    # Remove HTML tags
+    text = BeautifulSoup(content, 'html.parser').get_text()
+    # Remove extra spaces and newlines
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def make_snippet(summary_persian, summary):
+    """First SNIPPET_LENGTH characters of the Persian summary, else the English one."""
+    return (summary_persian or summary or '')[:SNIPPET_LENGTH]
+
+
+def enrich(content, url, summary, summary_persian):
+    """Derived columns stored with each content item, so the read path never recomputes them.
+
+    Returns a dict with content_text, domain, snippet and word_count.
+    """
+    content_text = html_to_text(content)
+    return {
+        'content_text': content_text,
+        'domain': extract_domain(url),
+        'snippet': make_snippet(summary_persian, summary),
+        'word_count': len(content_text.split()),
+    }
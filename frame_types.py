@@ -0,0 +1,43 @@
+import pandas as pd
+
+# Few distinct values repeated on many rows: stored once per category
+CATEGORY_COLUMNS = ['source', 'type', 'author', 'domain']
+# Free text: one Arrow buffer per column instead of a Python object per row
+TEXT_COLUMNS = ['title', 'title_persian', 'url', 'snippet']
+INTEGER_COLUMNS = ['id', 'views', 'word_count']
+FLOAT_COLUMNS = ['final_score']
+
+
+def compact_content_frame(df):
+    """Return df with content columns stored in compact dtypes. Safe to apply repeatedly.
+
+    Missing text values become pd.NA rather than None, so callers testing a single value
+    for truth should check pd.notna first.
+    """
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in TEXT_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('string[pyarrow]')
+    for column in INTEGER_COLUMNS:
+        if column in df:
+            values = pd.to_numeric(df[column])
+            if values.isna().any():
+                df[column] = values.astype('Int32')
+            else:
+                df[column] = pd.to_numeric(values, downcast='integer')
+    for column in FLOAT_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], downcast='float')
+    return df
+
+
+def memory_report(df):
+    """Bytes used by each column, largest first, including Python objects they reference."""
+    usage = df.memory_usage(deep=True, index=False)
+    return pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': usage,
+    }).sort_values('bytes', ascending=False)
@@ -1,10 +1,427 @@
 from googletrans import Translator
+import email.utils
+import hashlib
 import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import json
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Point OPENAI_BASE_URL at a local stub server to exercise the client without the real API
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+# Client-side limit shared by every thread of the process
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "60"))
+OPENAI_BURST = float(os.getenv("OPENAI_BURST", "5"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "10"))
+
+# Responses of cacheable calls are kept in a local SQLite file shared by every process
+OPENAI_CACHE_PATH = os.getenv("OPENAI_CACHE_PATH", os.path.join(os.getenv("CACHE_DIR", ".cache"), "openai_responses.sqlite3"))
+OPENAI_CACHE_TTL = float(os.getenv("OPENAI_CACHE_TTL", str(30 * 24 * 3600)))
+OPENAI_CACHE_MAX_BYTES = int(os.getenv("OPENAI_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# A read timeout means the request was sent and may still be processed (and billed), so it
+# is only retried for methods that are safe to repeat, never for POSTed completions
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# 429 error codes that waiting does not fix
+FINAL_ERROR_CODES = {'insufficient_quota', 'billing_hard_limit_reached'}
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_duration(value):
+    """Seconds in an OpenAI rate-limit reset header such as "20ms", "1s" or "6m0s"; None if unparsable."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date); None if absent."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, bursts of up to capacity.
+
+    pause() blocks all callers until a point in time, used when the server reports that
+    the rate limit is exhausted.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate if self._tokens < 1 else 0)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def completion_text(response_json):
+    """Content of the first choice of a chat completion, or None when there is no usable
+    one (no choices, empty content, or cut by the content filter)."""
+    try:
+        choice = response_json['choices'][0]
+        content = choice['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return None
+    if not isinstance(content, str) or not content.strip() or choice.get('finish_reason') == 'content_filter':
+        return None
+    return content
+
+
+def _normalize_prompt(text):
+    return re.sub(r'\s+', ' ', text).strip() if isinstance(text, str) else text
+
+
+def cache_key(path, payload):
+    """Key of a request: endpoint, model, hash of the whitespace-normalized prompt, other parameters."""
+    payload = dict(payload)
+    model = payload.pop('model', None)
+    messages = payload.pop('messages', None)
+    prompt = payload.pop('prompt', None)
+    if messages is not None:
+        prompt = [(message.get('role'), _normalize_prompt(message.get('content'))) for message in messages]
+    else:
+        prompt = _normalize_prompt(prompt)
+    prompt_hash = hashlib.sha256(json.dumps(prompt, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return json.dumps([path, model, prompt_hash, payload], sort_keys=True, ensure_ascii=False)
+
+
+class ResponseCache:
+    """SQLite-backed cache of API responses with a TTL and least-recently-used eviction
+    once the stored responses exceed max_bytes. Hit and miss counts are kept in the same
+    file, so they add up over every process using it (python manage.py openai-cache)."""
+
+    def __init__(self, path=OPENAI_CACHE_PATH, ttl=OPENAI_CACHE_TTL, max_bytes=OPENAI_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses(accessed_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    def _count(self, name):
+        self._conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key):
+        """Return the cached response for key, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count('misses')
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count('hits')
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        data = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        total = sum(size for _, size in rows)
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self):
+        """Hits and misses since the file was created or cleared, stored entries and their bytes."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+        return {'hits': counters.get('hits', 0), 'misses': counters.get('misses', 0), 'entries': entries, 'bytes': size}
+
+    def clear(self):
+        """Drop every stored response and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("UPDATE counters SET value = 0")
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when it cannot be opened."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            try:
+                _response_cache = ResponseCache()
+            except (OSError, sqlite3.Error) as e:
+                logging.error(f"OpenAI response cache disabled: {e}")
+                return None
+        return _response_cache
+
+
+class OpenAIClient:
+    """Shared HTTP client for the OpenAI REST API.
+
+    One pooled keep-alive session, (connect, read) timeouts, a token bucket shared across
+    threads, and retries with exponential backoff and full jitter on connection errors,
+    429 and 5xx responses. Retry-After and the x-ratelimit-* headers are honored. Read
+    timeouts of non-idempotent requests and 429s for an exhausted quota are not retried.
+    """
+
+    def __init__(self, api_key, base_url=OPENAI_BASE_URL, timeout=(OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT),
+                 max_retries=OPENAI_MAX_RETRIES, limiter=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = limiter or TokenBucket(OPENAI_REQUESTS_PER_MINUTE / 60.0, OPENAI_BURST)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=OPENAI_POOL_SIZE, pool_maxsize=OPENAI_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        })
+
+    def _backoff(self, attempt, response=None):
+        delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def _note_rate_limits(self, response):
+        for kind in ('requests', 'tokens'):
+            if response.headers.get(f'x-ratelimit-remaining-{kind}') == '0':
+                reset = parse_duration(response.headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    logging.warning(f"OpenAI {kind} rate limit exhausted, pausing for {reset:.1f}s")
+                    self.limiter.pause(reset)
+
+    @staticmethod
+    def _error_code(response):
+        try:
+            error = response.json().get('error') or {}
+        except (ValueError, AttributeError):
+            return None
+        if not isinstance(error, dict):
+            return None
+        return error.get('code') or error.get('type')
+
+    def _is_retryable(self, response):
+        if response.status_code not in RETRY_STATUS_CODES:
+            return False
+        return response.status_code != 429 or self._error_code(response) not in FINAL_ERROR_CODES
+
+    def request(self, method, path, **kwargs):
+        """Send a request and return the response. Raises requests.RequestException when it
+        still fails after the retries (HTTPError for error statuses)."""
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                if isinstance(e, requests.ReadTimeout) and method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"OpenAI request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._note_rate_limits(response)
+            if attempt < self.max_retries and self._is_retryable(response):
+                delay = self._backoff(attempt, response)
+                if response.status_code == 429:
+                    self.limiter.pause(delay)
+                logging.warning(f"OpenAI returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response
+
+    @staticmethod
+    def _cached(response_cache, key, path):
+        if not response_cache:
+            return None
+        try:
+            cached = response_cache.get(key)
+        except sqlite3.Error as e:
+            logging.error(f"Error reading the OpenAI response cache: {e}")
+            return None
+        if cached is None or completion_text(cached) is None:
+            # Entries without a usable answer (stored before they were refused) count as misses
+            return None
+        logging.debug("Answered %s from the response cache", path)
+        return cached
+
+    @staticmethod
+    def _store(response_cache, key, response_json):
+        # A refusal or an empty answer is not worth repeating on every later request
+        if not response_cache or completion_text(response_json) is None:
+            return
+        try:
+            response_cache.put(key, response_json)
+        except sqlite3.Error as e:
+            logging.error(f"Error writing the OpenAI response cache: {e}")
+
+    def post(self, path, payload, cache=False, **kwargs):
+        """POST a JSON payload and return the decoded JSON response.
+
+        With cache=True an identical earlier request (see cache_key) is answered from the
+        response cache without calling the API. Only chat completions with a usable answer
+        (see completion_text) are cached, so do not use it for other endpoints, e.g. images.
+        """
+        response_cache = get_response_cache() if cache else None
+        key = cache_key(path, payload) if response_cache else None
+        cached = self._cached(response_cache, key, path)
+        if cached is not None:
+            return cached
+
+        response_json = self.request("POST", path, json=payload, **kwargs).json()
+        self._store(response_cache, key, response_json)
+        return response_json
+
+    def stream(self, path, payload, cache=False, **kwargs):
+        """POST a chat completion with stream=True and yield the content deltas as they arrive.
+
+        The server-sent events are parsed line by line. Retries only cover the request
+        itself; once text has been yielded, a dropped connection, or a stream that ends
+        without a finish_reason, raises requests.RequestException to the consumer. With
+        cache=True a cached answer to the same non-streaming payload is yielded as one
+        chunk, and a stream that runs to the end is stored under that payload, so post()
+        and stream() share cache entries.
+        """
+        response_cache = get_response_cache() if cache else None
+        key = cache_key(path, payload) if response_cache else None
+        cached = self._cached(response_cache, key, path)
+        if cached is not None:
+            yield completion_text(cached)
+            return
+
+        response = self.request("POST", path, json={**payload, "stream": True}, stream=True, **kwargs)
+        parts = []
+        finish_reason = None
+        with response:
+            for line in response.iter_lines():
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[len(b'data:'):].strip()
+                if data == b'[DONE]':
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    logging.error(f"Skipping malformed server-sent event: {data[:200]!r}")
+                    continue
+                for choice in event.get('choices') or []:
+                    finish_reason = choice.get('finish_reason') or finish_reason
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+
+        if finish_reason is None:
+            # The server closed the connection cleanly, but before the end of the answer
+            raise requests.exceptions.ChunkedEncodingError(f"Stream from {path} ended before the response was complete")
+        self._store(response_cache, key, {'choices': [{
+            'message': {'role': 'assistant', 'content': ''.join(parts)},
+            'finish_reason': finish_reason,
+        }]})
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url=OPENAI_BASE_URL):
+    """Return the process-wide client for this API key, so connections and limits are shared."""
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            client = _clients[(api_key, base_url)] = OpenAIClient(api_key, base_url=base_url)
+        return client
+
+
 class TagGeneration:
     
     def __init__(self, model, api_key):
@@ -14,11 +431,6 @@ class TagGeneration:
     def ask_gpt(self, default, question):
         logging.debug("Sending request to OpenAI for tag generation")
 
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
         data = {
             "model": self.model,
             "messages": [{"role": "user", "content": question}],
@@ -27,9 +439,7 @@ class TagGeneration:
         logging.debug("Sending request to OpenAI with data: %s", data)
 
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            response_json = response.json()
+            response_json = get_client(self.api_key).post("/chat/completions", data, cache=True)
             logging.debug("Received response from OpenAI: %s", response_json)
 
             if 'choices' in response_json and len(response_json['choices']) > 0:
@@ -82,26 +492,22 @@ class Translation:
         translator = Translator()
         return translator.translate(content, src=src_lang, dest=dest_lang).text
 
-    def gpt_translate(self, content, src_lang, dest_lang):
-        logging.debug(f"Translating text from {src_lang} to {dest_lang}")
-
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+    def _translation_data(self, content, src_lang, dest_lang):
         prompt = f"Translate this news from {src_lang} to {dest_lang}, and return only the translated content. Keep the html structure: {content}"
 
-        data = {
+        return {
             "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 4000,
         }
 
+    def gpt_translate(self, content, src_lang, dest_lang):
+        logging.debug(f"Translating text from {src_lang} to {dest_lang}")
+
+        data = self._translation_data(content, src_lang, dest_lang)
+
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            response_json = response.json()
+            response_json = get_client(self.api_key).post("/chat/completions", data, cache=True)
 
             if 'choices' in response_json and len(response_json['choices']) > 0:
                 translation = response_json['choices'][0]['message']['content'].strip()
@@ -118,6 +524,22 @@ class Translation:
             logging.error(f"KeyError during translation processing: {e}")
             return ""
 
+    def gpt_translate_stream(self, content, src_lang, dest_lang):
+        """Yield the GPT translation in chunks as it is generated.
+
+        API errors are logged and re-raised as requests.RequestException, also after part of
+        the text was yielded, so a cut-off translation is never taken for a complete one.
+        """
+        logging.debug(f"Streaming translation from {src_lang} to {dest_lang}")
+
+        data = self._translation_data(content, src_lang, dest_lang)
+
+        try:
+            yield from get_client(self.api_key).stream("/chat/completions", data, cache=True)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"RequestException during translation: {e}")
+            raise
+
 
 class ArticleGeneration:
     
@@ -125,7 +547,7 @@ class ArticleGeneration:
         self.model = model
         self.api_key = api_key
 
-    def gpt_generate_article(self, title, source, url, date, news_content, matched_keywords=None):
+    def _article_data(self, title, source, url, date, news_content, matched_keywords=None):
         keywords_str = ', '.join(matched_keywords) if matched_keywords else ""
 
         question = f"""
@@ -144,24 +566,20 @@ class ArticleGeneration:
         Ensure the article is informative and engaging. Avoid unnecessary jargon, and keep it clear for a general audience.
         """
 
-        logging.debug("Sending request to OpenAI for article generation")
-
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        data = {
+        return {
             "model": self.model,
             "messages": [{"role": "user", "content": question}],
             "max_tokens": 3000
         }
+
+    def gpt_generate_article(self, title, source, url, date, news_content, matched_keywords=None):
+        logging.debug("Sending request to OpenAI for article generation")
+
+        data = self._article_data(title, source, url, date, news_content, matched_keywords)
         logging.debug("Sending request to OpenAI with data: %s", data)
 
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            response_json = response.json()
+            response_json = get_client(self.api_key).post("/chat/completions", data, cache=True)
             logging.debug("Received response from OpenAI: %s", response_json)
 
             if 'choices' in response_json and len(response_json['choices']) > 0:
@@ -172,11 +590,24 @@ class ArticleGeneration:
 
         except requests.exceptions.RequestException as e:
             logging.error(f"RequestException: {e}")
-            return self.api_key
+            return "No Article"
         except KeyError as e:
             logging.error(f"KeyError: {e}")
             return f"KeyError: {e}"
 
+    def gpt_generate_article_stream(self, title, source, url, date, news_content, matched_keywords=None):
+        """Yield the article in chunks as it is generated. API errors are logged and re-raised
+        as requests.RequestException, also after part of the article was yielded."""
+        logging.debug("Streaming article generation from OpenAI")
+
+        data = self._article_data(title, source, url, date, news_content, matched_keywords)
+
+        try:
+            yield from get_client(self.api_key).stream("/chat/completions", data, cache=True)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"RequestException: {e}")
+            raise
+
 
 class ImageGeneration:
     
@@ -187,11 +618,6 @@ class ImageGeneration:
     def gpt_generate_images(self, prompt, num_images=1):
         logging.debug("Sending request to OpenAI for image generation")
 
-        url = "https://api.openai.com/v1/images/generations"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
 
         if not prompt or not isinstance(prompt, str):
             logging.error("Invalid prompt provided for image generation.")
@@ -210,9 +636,7 @@ class ImageGeneration:
             logging.debug("Sending image generation request with data: %s", json.dumps(data, indent=2))
 
             try:
-                response = requests.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                response_json = response.json()
+                response_json = get_client(self.api_key).post("/images/generations", data)
                 logging.debug("Received response from OpenAI: %s", json.dumps(response_json, indent=2))
 
                 if 'data' in response_json and len(response_json['data']) > 0:
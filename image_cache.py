@@ -0,0 +1,101 @@
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+THUMBNAIL_SIZE = (int(os.getenv("THUMBNAIL_WIDTH", "480")), int(os.getenv("THUMBNAIL_HEIGHT", "480")))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+
+def make_thumbnail(image_data, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Resize encoded image bytes to fit within size and return them as WebP."""
+    with Image.open(io.BytesIO(image_data)) as image:
+        image.thumbnail(size)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("P", "LA", "PA") else "RGB")
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=quality, method=4)
+    return output.getvalue()
+
+
+class ImageCache:
+    """LRU cache of encoded images keyed by (content hash, variant), bounded by total bytes.
+
+    Keys are content hashes, so an entry never goes stale and identical images stored for
+    different articles share one entry.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def thumbnail(self, image_hash, load_image_data):
+        """Return the WebP thumbnail for image_hash, calling load_image_data() only on a miss."""
+        key = (image_hash, "thumbnail")
+        data = self.get(key)
+        if data is None:
+            image_data = load_image_data()
+            if not image_data:
+                return None
+            try:
+                data = make_thumbnail(image_data)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # Undecodable or oversized images are skipped, along with their full-size view
+                logging.error(f"Error creating thumbnail for image {image_hash}: {e}")
+                return None
+            self.put(key, data)
+        return data
+
+    def original(self, image_hash, load_image_data):
+        """Return the full-size image bytes for image_hash, calling load_image_data() only on a miss."""
+        key = (image_hash, "original")
+        data = self.get(key)
+        if data is None:
+            data = load_image_data()
+            if data:
+                self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Return the process-wide image cache shared by every dashboard session."""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
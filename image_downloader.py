@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "8"))
+# (connect, read) timeouts in seconds; the read timeout applies between received chunks
+IMAGE_CONNECT_TIMEOUT = float(os.getenv("IMAGE_CONNECT_TIMEOUT", "5"))
+IMAGE_READ_TIMEOUT = float(os.getenv("IMAGE_READ_TIMEOUT", "15"))
+# Budget for a whole download, so a host dripping bytes cannot hold a worker indefinitely
+IMAGE_TOTAL_TIMEOUT = float(os.getenv("IMAGE_TOTAL_TIMEOUT", "30"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+
+class ImageDownloadError(Exception):
+    pass
+
+
+class ImageDownloader:
+    """Downloads images in parallel over one pooled HTTP session.
+
+    Each download is bounded by the connect/read timeouts, by a total time budget checked
+    between chunks, and by max_bytes, so one slow or oversized image costs at most one
+    worker for about total_timeout + the read timeout, never the whole batch.
+    """
+
+    def __init__(self, workers=IMAGE_DOWNLOAD_WORKERS, timeout=(IMAGE_CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT),
+                 max_bytes=IMAGE_MAX_BYTES, total_timeout=IMAGE_TOTAL_TIMEOUT):
+        self.workers = max(int(workers), 1)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.total_timeout = total_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def download(self, image_url):
+        """Return the image bytes. Raises ImageDownloadError or requests.RequestException."""
+        deadline = time.monotonic() + self.total_timeout
+        with self.session.get(image_url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if not content_type.startswith('image/'):
+                raise ImageDownloadError(f"unexpected content type {content_type or 'none'!r}")
+            declared_length = response.headers.get('Content-Length')
+            if declared_length and declared_length.isdigit() and int(declared_length) > self.max_bytes:
+                raise ImageDownloadError(f"image is {declared_length} bytes, limit is {self.max_bytes}")
+            data = bytearray()
+            # read1 returns what one socket read delivers, where iter_content waits for a
+            # full chunk, so the deadline is also checked while a host drips bytes
+            while True:
+                chunk = response.raw.read1(IMAGE_CHUNK_SIZE, decode_content=True)
+                if not chunk:
+                    break
+                data.extend(chunk)
+                if len(data) > self.max_bytes:
+                    raise ImageDownloadError(f"image exceeds the {self.max_bytes} byte limit")
+                if time.monotonic() > deadline:
+                    raise ImageDownloadError(f"download took longer than {self.total_timeout}s")
+        if not data:
+            raise ImageDownloadError("empty response")
+        return bytes(data)
+
+    def download_many(self, image_urls):
+        """Download every URL concurrently. Returns a list aligned with image_urls, None for failures."""
+        image_urls = list(image_urls)
+        if not image_urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(image_urls)), thread_name_prefix="image-download") as pool:
+            return list(pool.map(self._download_or_none, image_urls))
+
+    def _download_or_none(self, image_url):
+        try:
+            return self.download(image_url)
+        except (requests.RequestException, ImageDownloadError) as e:
+            logging.error(f"Error downloading image {image_url}: {e}")
+            return None
+
+    def close(self):
+        self.session.close()
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader():
+    """Return the process-wide downloader, so HTTP connections are reused across calls."""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = ImageDownloader()
+        return _downloader
@@ -0,0 +1,50 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+
+class KeywordMatcher:
+    """Keyword/weight pairs compiled once and matched against many lowercased plain texts.
+
+    A keyword matches a text when it occurs at least weight times, counted like
+    str.count (non-overlapping, case-insensitive). One regex alternation of all keywords
+    runs first, so texts containing none of them are rejected in a single C-level pass
+    and only the remaining ones are counted keyword by keyword.
+    """
+
+    def __init__(self, keyword_weight_pairs):
+        self.pairs = [(keyword, keyword.lower(), int(weight)) for keyword, weight in keyword_weight_pairs if keyword]
+        self._any_keyword = None
+        if self.pairs:
+            needles = sorted({needle for _, needle, _ in self.pairs}, key=len, reverse=True)
+            self._any_keyword = re.compile('|'.join(re.escape(needle) for needle in needles))
+
+    def __bool__(self):
+        return bool(self.pairs)
+
+    def matched(self, text):
+        """Return the keywords matched by one lowercased text, in input order."""
+        if not text or self._any_keyword is None or not self._any_keyword.search(text):
+            return []
+        return [keyword for keyword, needle, weight in self.pairs if text.count(needle) >= weight]
+
+    def match(self, texts):
+        """Match a sequence of lowercased texts.
+
+        Returns (mask, matched): a boolean array marking texts with at least one matched
+        keyword, and a list aligned with texts holding each one's matched keywords.
+        """
+        matched = [self.matched(text) for text in texts]
+        mask = np.fromiter((bool(keywords) for keywords in matched), dtype=bool, count=len(matched))
+        return mask, matched
+
+
+@lru_cache(maxsize=32)
+def _compile(keyword_weight_pairs):
+    return KeywordMatcher(keyword_weight_pairs)
+
+
+def compile_keywords(keyword_weight_pairs):
+    """Return a matcher for the pairs, reusing the one compiled for the same pairs before."""
+    return _compile(tuple((keyword, int(weight)) for keyword, weight in keyword_weight_pairs if keyword))
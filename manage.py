@@ -0,0 +1,180 @@
+"""Maintenance commands for the content database.
+
+Schema changes are applied explicitly, never on import:
+
+    python manage.py status
+    python manage.py migrate
+    python manage.py backfill
+
+When migrate reports URLs stored more than once, merge those rows (their tags, images
+and translations move to the oldest copy) and migrate again:
+
+    python manage.py merge-duplicate-urls
+
+Hit rate and size of the local GPT response cache (--clear empties it):
+
+    python manage.py openai-cache
+
+Move image bytes out of ContentImages into the blob store (BLOB_STORE_DIR):
+
+    python manage.py migrate-blobs
+
+Index benchmark, before and after migrating:
+
+    python manage.py benchmark --save before.json
+    python manage.py migrate
+    python manage.py benchmark --compare before.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from database import DatabaseManager, close_pool
+from gpt_request import get_response_cache
+from migrations import pending_migrations
+from frame_types import memory_report
+
+# Queries issued by the dashboard and the crawler, with the lookup each one depends on.
+# Parameters are sampled from existing rows so the benchmark runs against real data.
+BENCHMARK_QUERIES = {
+    'content_exists (Content.url)': (
+        "SELECT COUNT(*) FROM Content WHERE url = ?",
+        "SELECT TOP 1 url FROM Content WHERE url IS NOT NULL ORDER BY id DESC",
+    ),
+    'news list page (Content.date)': (
+        "SELECT TOP 21 id, title, date FROM Content WHERE date >= ? ORDER BY date DESC, id DESC",
+        "SELECT DATEADD(day, -7, MAX(date)) FROM Content",
+    ),
+    'load_tags (ContentTags.content_id)': (
+        "SELECT t.tag FROM ContentTags ct JOIN Tags t ON ct.tag_id = t.id WHERE ct.content_id = ?",
+        "SELECT TOP 1 content_id FROM ContentTags ORDER BY content_id DESC",
+    ),
+    'content by tag (ContentTags.tag_id)': (
+        "SELECT content_id FROM ContentTags WHERE tag_id = ?",
+        "SELECT TOP 1 tag_id FROM ContentTags ORDER BY tag_id DESC",
+    ),
+    'image refs (ContentImages.content_id)': (
+        "SELECT id FROM ContentImages WHERE content_id = ?",
+        "SELECT TOP 1 content_id FROM ContentImages ORDER BY id DESC",
+    ),
+}
+
+
+def run_benchmark(db_manager, repeat):
+    """Time each benchmark query and return the median duration in milliseconds."""
+    results = {}
+    with db_manager.connection() as conn:
+        cursor = conn.cursor()
+        for name, (query, sample_query) in BENCHMARK_QUERIES.items():
+            sample = cursor.execute(sample_query).fetchone()
+            if sample is None or sample[0] is None:
+                print(f"{name}: skipped, no sample data")
+                continue
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(query, (sample[0],)).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+    return results
+
+
+def print_benchmark(results, baseline=None):
+    for name, duration in results.items():
+        line = f"{name:<45} {duration:10.2f} ms"
+        if baseline and name in baseline:
+            line = f"{name:<45} {baseline[name]:10.2f} ms -> {duration:10.2f} ms ({baseline[name] / max(duration, 1e-6):.1f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('migrate', help="apply pending schema migrations")
+    subparsers.add_parser('status', help="list schema migrations that have not been applied")
+    subparsers.add_parser('rebuild-search-index', help="index every content item from scratch")
+    subparsers.add_parser('rebuild-stats', help="recompute the daily statistics rollup from Content, picking up updated view counts")
+    cache_parser = subparsers.add_parser('openai-cache', help="show hit/miss counts and size of the GPT response cache")
+    cache_parser.add_argument('--clear', action='store_true', help="drop every cached response and reset the counts")
+    subparsers.add_parser('merge-duplicate-urls', help="merge content rows sharing a URL into the oldest one")
+    subparsers.add_parser('snapshot-memory', help="compare the content frame's memory use with and without compact dtypes")
+
+    backfill_parser = subparsers.add_parser('backfill', help="compute stored plain text, domain and snippet for older rows")
+    backfill_parser.add_argument('--batch-size', type=int, default=500)
+
+    blobs_parser = subparsers.add_parser('migrate-blobs', help="move stored image bytes into the blob store")
+    blobs_parser.add_argument('--batch-size', type=int, default=100)
+
+    benchmark_parser = subparsers.add_parser('benchmark', help="time the indexed lookups")
+    benchmark_parser.add_argument('--repeat', type=int, default=20)
+    benchmark_parser.add_argument('--save', help="write the timings to this JSON file")
+    benchmark_parser.add_argument('--compare', help="show timings next to a file written by --save")
+
+    args = parser.parse_args()
+    if args.command == 'openai-cache':
+        # Local SQLite file only; no database connection needed
+        response_cache = get_response_cache()
+        if response_cache is None:
+            print("The response cache could not be opened, see the log.")
+            return
+        if args.clear:
+            response_cache.clear()
+        stats = response_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = f"{stats['hits'] / lookups:.1%}" if lookups else "n/a"
+        print(f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {hit_rate}")
+        print(f"entries: {stats['entries']}  size: {stats['bytes'] / 1024 / 1024:.1f} MiB of {response_cache.max_bytes / 1024 / 1024:.0f} MiB")
+        return
+
+    db_manager = DatabaseManager()
+    db_manager.connect()
+
+    if args.command == 'migrate':
+        applied = db_manager.migrate()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+    elif args.command == 'status':
+        with db_manager.connection() as conn:
+            pending = pending_migrations(conn)
+        for version, description, _ in pending:
+            print(f"pending  {version:>4}  {description}")
+        if not pending:
+            print("Schema is up to date.")
+    elif args.command == 'backfill':
+        updated = db_manager.backfill_enrichment(batch_size=args.batch_size)
+        print(f"Backfilled {updated} content items.")
+    elif args.command == 'merge-duplicate-urls':
+        merged = db_manager.merge_duplicate_urls()
+        print(f"Merged {merged} duplicate content rows." if merged else "No duplicate URLs found.")
+    elif args.command == 'snapshot-memory':
+        plain = memory_report(db_manager.load_content_data())
+        compact = memory_report(db_manager.load_content_data(compact=True))
+        report = plain.join(compact, lsuffix='_default', rsuffix='_compact')
+        print(report.to_string())
+        print(f"total: {plain['bytes'].sum() / 1024 / 1024:.1f} MiB -> {compact['bytes'].sum() / 1024 / 1024:.1f} MiB")
+    elif args.command == 'rebuild-stats':
+        rows = db_manager.rebuild_daily_stats()
+        print(f"Daily statistics rebuilt with {rows} rows.")
+    elif args.command == 'rebuild-search-index':
+        tokens = db_manager.rebuild_search_index()
+        print(f"Search index rebuilt with {tokens} distinct tokens.")
+    elif args.command == 'migrate-blobs':
+        moved = db_manager.move_image_blobs(batch_size=args.batch_size)
+        print(f"Moved {moved} images to the blob store.")
+    elif args.command == 'benchmark':
+        results = run_benchmark(db_manager, args.repeat)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_benchmark(results, baseline)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
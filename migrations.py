@@ -0,0 +1,329 @@
+import logging
+
+import pyodbc
+
+SCHEMA_VERSION_TABLE_SQL = """
+IF OBJECT_ID(N'[dbo].[SchemaVersion]', N'U') IS NULL
+BEGIN
+    CREATE TABLE SchemaVersion (
+        version INT PRIMARY KEY,
+        description NVARCHAR(255),
+        applied_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+END
+"""
+
+# Recomputes ContentDailyStats from Content; also run by python manage.py rebuild-stats
+DAILY_STATS_REBUILD_SQL = """
+DELETE FROM ContentDailyStats WITH (TABLOCKX);
+INSERT INTO ContentDailyStats (day, source, type, count, total_views, score_sum, score_count)
+SELECT CAST(date AS DATE), COALESCE(source, N''), COALESCE(type, N''),
+       COUNT(*), COALESCE(SUM(CAST(views AS BIGINT)), 0), COALESCE(SUM(final_score), 0), COUNT(final_score)
+FROM Content
+WHERE date IS NOT NULL
+GROUP BY CAST(date AS DATE), COALESCE(source, N''), COALESCE(type, N'');
+"""
+
+# Merges Content rows sharing a URL into the oldest one: tags and images are moved to it
+# and translations it lacks are taken from the newest copy that has them, then the
+# copies are deleted. Only run on request, by python manage.py merge-duplicate-urls.
+DUPLICATE_URLS_MERGE_SQL = [
+    """
+    IF OBJECT_ID('tempdb..#duplicate_content') IS NOT NULL DROP TABLE #duplicate_content;
+    SELECT id, keep_id
+    INTO #duplicate_content
+    FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY url) AS keep_id
+        FROM Content
+        WHERE url IS NOT NULL
+    ) copies
+    WHERE id <> keep_id;
+    """,
+    """
+    INSERT INTO ContentTags (content_id, tag_id)
+    SELECT DISTINCT d.keep_id, ct.tag_id
+    FROM ContentTags ct
+    JOIN #duplicate_content d ON ct.content_id = d.id
+    WHERE NOT EXISTS (SELECT 1 FROM ContentTags kept WHERE kept.content_id = d.keep_id AND kept.tag_id = ct.tag_id);
+    """,
+    """
+    UPDATE ci SET content_id = d.keep_id
+    FROM ContentImages ci
+    JOIN #duplicate_content d ON ci.content_id = d.id;
+    """,
+    """
+    UPDATE kept SET
+        title_persian = COALESCE(NULLIF(kept.title_persian, N''), (
+            SELECT TOP 1 c.title_persian FROM Content c JOIN #duplicate_content d ON c.id = d.id
+            WHERE d.keep_id = kept.id AND c.title_persian <> N'' ORDER BY c.id DESC)),
+        content_persian = COALESCE(NULLIF(kept.content_persian, N''), (
+            SELECT TOP 1 c.content_persian FROM Content c JOIN #duplicate_content d ON c.id = d.id
+            WHERE d.keep_id = kept.id AND c.content_persian <> N'' ORDER BY c.id DESC)),
+        summary_persian = COALESCE(NULLIF(kept.summary_persian, N''), (
+            SELECT TOP 1 c.summary_persian FROM Content c JOIN #duplicate_content d ON c.id = d.id
+            WHERE d.keep_id = kept.id AND c.summary_persian <> N'' ORDER BY c.id DESC))
+    FROM Content kept
+    WHERE kept.id IN (SELECT keep_id FROM #duplicate_content);
+    """,
+    "DELETE FROM Content WHERE id IN (SELECT id FROM #duplicate_content);",
+]
+
+# Ordered list of (version, description, statements). Applied versions are recorded in
+# SchemaVersion and a migration is pending until its own version is recorded, so the
+# baseline (version 0) also runs once on databases created before it was added.
+# Never edit a migration that has shipped, add a new one instead.
+MIGRATIONS = [
+    (0, "Baseline schema", [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND type in (N'U'))
+        BEGIN
+            CREATE TABLE Content (
+                id INT IDENTITY(1,1) PRIMARY KEY,
+                title NVARCHAR(255),
+                title_persian NVARCHAR(255),
+                date DATETIME,
+                content NVARCHAR(MAX),
+                content_persian NVARCHAR(MAX),
+                url NVARCHAR(500),
+                author NVARCHAR(255),
+                views INT,
+                source NVARCHAR(255),
+                summary NVARCHAR(MAX),
+                summary_persian NVARCHAR(MAX),
+                final_score FLOAT,
+                type NVARCHAR(100)
+            );
+        END
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[ContentImages]') AND type in (N'U'))
+        BEGIN
+            CREATE TABLE ContentImages (
+                id INT IDENTITY(1,1) PRIMARY KEY,
+                content_id INT,
+                image_url NVARCHAR(500),
+                FOREIGN KEY (content_id) REFERENCES Content(id) ON DELETE CASCADE
+            );
+        END
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[Tags]') AND type in (N'U'))
+        BEGIN
+            CREATE TABLE Tags (
+                id INT IDENTITY(1,1) PRIMARY KEY,
+                tag NVARCHAR(255) UNIQUE
+            );
+        END
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[ContentTags]') AND type in (N'U'))
+        BEGIN
+            CREATE TABLE ContentTags (
+                content_id INT,
+                tag_id INT,
+                PRIMARY KEY (content_id, tag_id),
+                FOREIGN KEY (content_id) REFERENCES Content(id) ON DELETE CASCADE,
+                FOREIGN KEY (tag_id) REFERENCES Tags(id) ON DELETE CASCADE
+            );
+        END
+        """,
+    ]),
+    (1, "Index content lookups by date, url, tag and image owner", [
+        # A unique index needs unique data. Duplicates are reported rather than deleted,
+        # since deleting a row cascades to its tags and images; merging them is opt-in.
+        """
+        DECLARE @duplicates INT, @examples NVARCHAR(MAX);
+        SELECT @duplicates = COUNT(*)
+        FROM (SELECT url FROM Content WHERE url IS NOT NULL GROUP BY url HAVING COUNT(*) > 1) duplicate_urls;
+        IF @duplicates > 0
+        BEGIN
+            SELECT @examples = COALESCE(@examples + N', ', N'') + url
+            FROM (SELECT TOP 5 url FROM Content WHERE url IS NOT NULL GROUP BY url HAVING COUNT(*) > 1 ORDER BY url) duplicate_urls;
+            DECLARE @message NVARCHAR(2048) = CONCAT(
+                @duplicates, N' URLs are stored in more than one Content row, e.g. ', LEFT(@examples, 1500),
+                N'. Run python manage.py merge-duplicate-urls, then migrate again.'
+            );
+            THROW 50001, @message, 1;
+        END
+        """,
+        # NVARCHAR(500) is 1000 bytes, within the 1700 byte limit of nonclustered index keys,
+        # so the URL is indexed directly rather than through a hash column.
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'UX_Content_url' AND object_id = OBJECT_ID(N'[dbo].[Content]'))
+            CREATE UNIQUE INDEX UX_Content_url ON Content(url) WHERE url IS NOT NULL;
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Content_date' AND object_id = OBJECT_ID(N'[dbo].[Content]'))
+            CREATE INDEX IX_Content_date ON Content(date DESC, id DESC);
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ContentTags_tag_id' AND object_id = OBJECT_ID(N'[dbo].[ContentTags]'))
+            CREATE INDEX IX_ContentTags_tag_id ON ContentTags(tag_id);
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ContentImages_content_id' AND object_id = OBJECT_ID(N'[dbo].[ContentImages]'))
+            CREATE INDEX IX_ContentImages_content_id ON ContentImages(content_id);
+        """,
+    ]),
+    (2, "Persian columns and Unicode text columns on Content", [
+        # Older Content tables predate the Persian columns or stored the bodies as TEXT
+        """
+        IF COL_LENGTH('Content', 'title_persian') IS NULL
+            ALTER TABLE Content ADD title_persian NVARCHAR(255);
+        IF COL_LENGTH('Content', 'content_persian') IS NULL
+            ALTER TABLE Content ADD content_persian NVARCHAR(MAX);
+        IF COL_LENGTH('Content', 'summary_persian') IS NULL
+            ALTER TABLE Content ADD summary_persian NVARCHAR(MAX);
+        """,
+        """
+        IF EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'content' AND TYPE_NAME(system_type_id) <> 'nvarchar')
+            ALTER TABLE Content ALTER COLUMN content NVARCHAR(MAX);
+        IF EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'content_persian' AND TYPE_NAME(system_type_id) <> 'nvarchar')
+            ALTER TABLE Content ALTER COLUMN content_persian NVARCHAR(MAX);
+        IF EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'summary' AND TYPE_NAME(system_type_id) <> 'nvarchar')
+            ALTER TABLE Content ALTER COLUMN summary NVARCHAR(MAX);
+        IF EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID(N'[dbo].[Content]') AND name = 'summary_persian' AND TYPE_NAME(system_type_id) <> 'nvarchar')
+            ALTER TABLE Content ALTER COLUMN summary_persian NVARCHAR(MAX);
+        """,
+    ]),
+    (3, "Binary image data on ContentImages", [
+        # insert_images and load_images store the downloaded image itself next to its URL
+        """
+        IF COL_LENGTH('ContentImages', 'image_data') IS NULL
+            ALTER TABLE ContentImages ADD image_data VARBINARY(MAX);
+        """,
+    ]),
+    (4, "SHA-256 content hash on ContentImages", [
+        # Lets the dashboard key its thumbnail cache without reading the image blobs
+        """
+        IF COL_LENGTH('ContentImages', 'image_hash') IS NULL
+            ALTER TABLE ContentImages ADD image_hash CHAR(64);
+        """,
+        """
+        UPDATE ContentImages
+        SET image_hash = LOWER(CONVERT(CHAR(64), HASHBYTES('SHA2_256', image_data), 2))
+        WHERE image_hash IS NULL AND image_data IS NOT NULL;
+        """,
+    ]),
+    (5, "Image metadata on ContentImages for blob store references", [
+        # Image bytes move to the blob store (python manage.py migrate-blobs); rows keep
+        # the hash plus what the dashboard needs without reading the blob
+        """
+        IF COL_LENGTH('ContentImages', 'size_bytes') IS NULL
+            ALTER TABLE ContentImages ADD size_bytes INT;
+        IF COL_LENGTH('ContentImages', 'content_type') IS NULL
+            ALTER TABLE ContentImages ADD content_type NVARCHAR(100);
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ContentImages_image_hash' AND object_id = OBJECT_ID(N'[dbo].[ContentImages]'))
+            CREATE INDEX IX_ContentImages_image_hash ON ContentImages(image_hash);
+        """,
+    ]),
+    (6, "Derived columns on Content computed at ingest time", [
+        # Filled by insert_content_items, and for older rows by python manage.py backfill
+        """
+        IF COL_LENGTH('Content', 'content_text') IS NULL
+            ALTER TABLE Content ADD content_text NVARCHAR(MAX);
+        IF COL_LENGTH('Content', 'domain') IS NULL
+            ALTER TABLE Content ADD domain NVARCHAR(255);
+        IF COL_LENGTH('Content', 'snippet') IS NULL
+            ALTER TABLE Content ADD snippet NVARCHAR(400);
+        IF COL_LENGTH('Content', 'word_count') IS NULL
+            ALTER TABLE Content ADD word_count INT;
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Content_domain' AND object_id = OBJECT_ID(N'[dbo].[Content]'))
+            CREATE INDEX IX_Content_domain ON Content(domain);
+        """,
+    ]),
+    (7, "Daily content rollup for the statistics page", [
+        # Sums rather than averages, so inserts can add to a row; missing source/type are
+        # stored as '' because they are part of the key
+        """
+        IF OBJECT_ID(N'[dbo].[ContentDailyStats]', N'U') IS NULL
+        BEGIN
+            CREATE TABLE ContentDailyStats (
+                day DATE NOT NULL,
+                source NVARCHAR(255) NOT NULL,
+                type NVARCHAR(100) NOT NULL,
+                count INT NOT NULL,
+                total_views BIGINT NOT NULL,
+                score_sum FLOAT NOT NULL,
+                score_count INT NOT NULL,
+                PRIMARY KEY (day, source, type)
+            );
+        END
+        """,
+        DAILY_STATS_REBUILD_SQL,
+    ]),
+    (8, "Row version on Content for incremental refreshes", [
+        # Changes on every insert and update, so readers can pull changed rows (views,
+        # scores, translations) and not only rows with a new id
+        """
+        IF COL_LENGTH('Content', 'row_version') IS NULL
+            ALTER TABLE Content ADD row_version ROWVERSION;
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Content_row_version' AND object_id = OBJECT_ID(N'[dbo].[Content]'))
+            CREATE INDEX IX_Content_row_version ON Content(row_version);
+        """,
+    ]),
+]
+
+# Name of the application lock that keeps two processes from migrating at the same time
+MIGRATION_LOCK = "content_dashboard_schema_migrations"
+
+
+def applied_versions(conn):
+    """Return the set of migration versions already applied to the database. Runs no DDL."""
+    cursor = conn.cursor()
+    if cursor.execute("SELECT OBJECT_ID(N'[dbo].[SchemaVersion]', N'U')").fetchone()[0] is None:
+        return set()
+    return {row.version for row in cursor.execute("SELECT version FROM SchemaVersion").fetchall()}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def apply_migrations(conn, lock_timeout_ms=60000):
+    """Apply pending migrations in version order, each in its own transaction.
+
+    Concurrent callers are serialized with an application lock and re-check what is
+    pending once they hold it. Returns the list of applied versions. Stops at the first
+    failing migration and re-raises its error after rolling it back.
+    """
+    if not pending_migrations(conn):
+        return []
+
+    cursor = conn.cursor()
+    lock_result = cursor.execute(
+        "SET NOCOUNT ON; DECLARE @result INT; "
+        "EXEC @result = sp_getapplock @Resource = ?, @LockMode = 'Exclusive', @LockOwner = 'Session', @LockTimeout = ?; "
+        "SELECT @result;",
+        (MIGRATION_LOCK, lock_timeout_ms),
+    ).fetchone()[0]
+    if lock_result < 0:
+        raise pyodbc.OperationalError(f"Could not acquire the schema migration lock (sp_getapplock returned {lock_result}).")
+
+    applied = []
+    try:
+        cursor.execute(SCHEMA_VERSION_TABLE_SQL)
+        conn.commit()
+        for version, description, statements in pending_migrations(conn):
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO SchemaVersion (version, description) VALUES (?, ?)", (version, description))
+                conn.commit()
+            except pyodbc.Error as e:
+                conn.rollback()
+                logging.error(f"Error applying migration {version} ({description}): {e}")
+                raise
+            logging.warning(f"Applied migration {version}: {description}")
+            applied.append(version)
+    finally:
+        cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", (MIGRATION_LOCK,))
+        conn.commit()
+    return applied
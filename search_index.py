@@ -0,0 +1,196 @@
+import bisect
+import os
+import pickle
+import re
+import unicodedata
+
+_FORMAT_VERSION = 2
+# persist() rewrites the whole index once its change log reaches this share of the index file
+_LOG_COMPACTION_RATIO = 0.5
+
+# Arabic code points that Persian text mixes in for the same letters
+_CHARACTER_FOLDING = str.maketrans({
+    'ي': 'ی',  # Arabic yeh -> Persian yeh
+    'ى': 'ی',  # alef maksura -> Persian yeh
+    'ك': 'ک',  # Arabic kaf -> Persian keheh
+    'ۀ': 'ه',  # heh with yeh above -> heh
+    'ة': 'ه',  # teh marbuta -> heh
+    'أ': 'ا',  # alef with hamza above -> alef
+    'إ': 'ا',  # alef with hamza below -> alef
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Persian digits
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+})
+# Diacritics (harakat, superscript alef) and tatweel carry no meaning for search; zero-width
+# joiners/non-joiners and direction marks are dropped so "می‌روم" and "میروم" match
+_IGNORED_CHARACTERS = re.compile(r'[\u064b-\u065f\u0670\u0640\u200c-\u200f]')
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    """Normalize Persian and English text for indexing and querying."""
+    text = unicodedata.normalize('NFKC', text).translate(_CHARACTER_FOLDING)
+    return _IGNORED_CHARACTERS.sub('', text).lower()
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return _TOKEN.findall(normalize_text(text))
+
+
+class SearchIndex:
+    """Inverted index from normalized tokens to the ids of the content items containing them.
+
+    Items are only ever added: re-adding an id after its text changed adds the new tokens,
+    and a rebuild drops tokens of text that was removed. watermark is the highest
+    Content.row_version indexed, used to top the index up with inserted and updated rows.
+
+    On disk the index is a full copy (save) plus a log of the additions made since
+    (persist), which load replays. Only one process should write the files.
+    """
+
+    def __init__(self, watermark=0):
+        self.postings = {}
+        self.watermark = watermark
+        # Additions not written to disk yet, as (content id, tokens)
+        self._pending = []
+        # Set when the change log cannot describe the index any more: load() found a damaged
+        # record (appending after it would hide the new records from the next load), or
+        # items were added with track=False. persist() then rewrites everything.
+        self._needs_save = False
+        self._vocabulary = None
+
+    @property
+    def dirty(self):
+        """Whether the index holds changes not written to disk yet."""
+        return bool(self._pending)
+
+    def add(self, content_id, *texts, track=True):
+        """Index texts under content_id. With track=False the addition is not kept for
+        persist(), for processes that only read the saved index."""
+        tokens = set()
+        for text in texts:
+            tokens.update(tokenize(text))
+        self._add_tokens(int(content_id), tokens)
+        if track:
+            self._pending.append((int(content_id), tokens))
+        else:
+            self._needs_save = True
+
+    def _add_tokens(self, content_id, tokens):
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = {content_id}
+                self._vocabulary = None
+            else:
+                ids.add(content_id)
+
+    def _prefix_ids(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        ids = set()
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            ids |= self.postings[self._vocabulary[position]]
+            position += 1
+        return ids
+
+    def _term_ids(self, term):
+        prefix = term.endswith('*')
+        tokens = tokenize(term)
+        if not tokens:
+            return None
+        # A term that normalizes to several tokens (e.g. "e-mail") needs all of them
+        ids = None
+        for position, token in enumerate(tokens):
+            if prefix and position == len(tokens) - 1:
+                token_ids = self._prefix_ids(token)
+            else:
+                token_ids = self.postings.get(token, set())
+            ids = token_ids if ids is None else ids & token_ids
+        return ids
+
+    def search(self, query):
+        """Return the set of ids matching query.
+
+        Terms separated by spaces must all match (AND); groups separated by OR or | match
+        if any group does. A trailing * matches words starting with the term, e.g. "bit*".
+        """
+        results = set()
+        for group in re.split(r'\s+(?:OR|\|)\s+', query.strip()):
+            group_ids = None
+            for term in group.split():
+                term_ids = self._term_ids(term)
+                if term_ids is None:
+                    continue
+                group_ids = term_ids if group_ids is None else group_ids & term_ids
+                if not group_ids:
+                    break
+            if group_ids:
+                results |= group_ids
+        return results
+
+    def save(self, path):
+        """Write the whole index atomically and start a new, empty change log."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((_FORMAT_VERSION, self.watermark, self.postings), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        if os.path.exists(f"{path}.log"):
+            os.remove(f"{path}.log")
+        self._pending = []
+        self._needs_save = False
+
+    def persist(self, path):
+        """Write the changes made since the last save or persist.
+
+        They are appended to the change log as one record, so the cost follows the size
+        of the change; the whole index is rewritten instead when there is no saved copy
+        or the log has grown past _LOG_COMPACTION_RATIO of it.
+        """
+        if not self._pending and not self._needs_save and os.path.exists(path):
+            return
+        log_path = f"{path}.log"
+        try:
+            index_size = os.path.getsize(path)
+            log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        except OSError:
+            index_size = log_size = None
+        if index_size is None or self._needs_save or log_size > index_size * _LOG_COMPACTION_RATIO:
+            self.save(path)
+            return
+        with open(log_path, 'ab') as f:
+            f.write(pickle.dumps((self.watermark, self._pending), protocol=pickle.HIGHEST_PROTOCOL))
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    @classmethod
+    def load(cls, path):
+        """Load the saved index and replay its change log."""
+        # The files are written by save() and persist() into the local cache directory,
+        # never downloaded
+        with open(path, 'rb') as f:
+            version, watermark, postings = pickle.load(f)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"{path} has index format {version}, expected {_FORMAT_VERSION}")
+        index = cls(watermark=watermark)
+        index.postings = postings
+        if os.path.exists(f"{path}.log"):
+            log_size = os.path.getsize(f"{path}.log")
+            with open(f"{path}.log", 'rb') as f:
+                while f.tell() < log_size:
+                    try:
+                        watermark, additions = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError, ValueError, TypeError):
+                        # A record cut short by a crash: the rows after the last complete
+                        # one are read again from the database on the next top-up
+                        index._needs_save = True
+                        break
+                    for content_id, tokens in additions:
+                        index._add_tokens(content_id, tokens)
+                    index.watermark = watermark
+        return index
+
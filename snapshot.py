@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+from database import CACHE_DIR, CONTENT_LIST_COLUMNS
+from domains import extract_domains
+from frame_types import compact_content_frame, memory_report
+
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+SNAPSHOT_COMPACT = os.getenv("SNAPSHOT_COMPACT", "1") == "1"
+# The news list reads snippets from SQL with each page, so the snapshot does not keep them
+SNAPSHOT_DROP_COLUMNS = ['snippet']
+
+# Arrow IPC copy of the snapshot, memory-mapped on startup instead of reading the whole
+# table over ODBC. Set SNAPSHOT_CACHE_PATH to an empty string to disable it.
+SNAPSHOT_CACHE_PATH = os.getenv("SNAPSHOT_CACHE_PATH", os.path.join(CACHE_DIR, "content_snapshot.arrow"))
+# The file is rewritten at most this often by the background refresher
+SNAPSHOT_CACHE_WRITE_SECONDS = int(os.getenv("SNAPSHOT_CACHE_WRITE_SECONDS", "900"))
+# Bump when the way the frame is prepared changes; files written by other versions are ignored
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+class ContentSnapshot:
+    """One in-memory copy of the Content table per process, shared by every session.
+
+    The published frame is replaced, never modified, so readers may hold on to it
+    without locking. It is indexed by id (the id column is kept as well), so row()
+    is a hash lookup. Inserted and updated rows are pulled in by a background thread
+    using the highest loaded Content.row_version as a watermark.
+    """
+
+    def __init__(self, db_manager, refresh_interval=SNAPSHOT_REFRESH_SECONDS, compact=SNAPSHOT_COMPACT):
+        self.db_manager = db_manager
+        self.refresh_interval = refresh_interval
+        self.compact = compact
+        self._data = pd.DataFrame()
+        self._watermark = None
+        self._last_write = None
+        # Serializes refreshes so two merges never race and drop each other's rows.
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def watermark(self):
+        return self._watermark
+
+    def frame(self):
+        """Return the current snapshot. Callers must treat it as read-only."""
+        return self._data
+
+    def load(self):
+        """Load the table once: from the local snapshot file plus the rows inserted or
+        updated since it was written, or in full from the database when there is no usable
+        file or rows were deleted since."""
+        with self._lock:
+            cached = self._read_cache()
+            if cached is not None:
+                data, watermark, max_id = cached
+                self._publish(data, watermark)
+                new_rows = self.db_manager.load_content_data(since_version=watermark)
+                if not new_rows.empty:
+                    self._merge(self._prepare(new_rows), self._version_of(new_rows))
+                if not self._covers_database(max_id):
+                    logging.warning("Ignoring snapshot cache: rows were deleted from the database since it was written.")
+                    cached = None
+            if cached is None:
+                data = self.db_manager.load_content_data()
+                self._publish(self._prepare(data), self._version_of(data))
+                new_rows = data
+        logging.warning(
+            f"Content snapshot loaded with {len(self._data)} rows "
+            f"({'from the local cache' if cached is not None else 'from the database'}), "
+            f"{self.memory_report()['bytes'].sum() / 1024 / 1024:.1f} MiB."
+        )
+        if not new_rows.empty:
+            self._write_cache()
+
+    def row(self, content_id):
+        """Return one content item by id as a Series, with missing values as None.
+
+        Rows inserted after the last refresh are fetched by primary key. Returns None when
+        the id does not exist.
+        """
+        data = self._data
+        content_id = int(content_id)
+        if not data.empty and content_id in data.index:
+            row = data.loc[content_id]
+        else:
+            rows = self.db_manager.load_content_rows([content_id])
+            if rows.empty:
+                return None
+            row = self._prepare(rows).iloc[0]
+        # Compact columns mark missing values with pd.NA, which has no truth value
+        return row.astype(object).where(row.notna(), None)
+
+    def memory_report(self):
+        """Bytes used by each column of the current snapshot."""
+        return memory_report(self._data)
+
+    def refresh(self):
+        """Merge rows inserted or updated since the last refresh. Returns their number.
+
+        The snapshot file is rewritten at most every SNAPSHOT_CACHE_WRITE_SECONDS.
+        """
+        with self._lock:
+            new_rows = self.db_manager.load_content_data(since_version=self._watermark)
+            if new_rows.empty:
+                return 0
+            self._merge(self._prepare(new_rows), self._version_of(new_rows))
+        logging.warning(f"Content snapshot refreshed with {len(new_rows)} new or updated rows.")
+        if self._last_write is None or time.monotonic() - self._last_write >= SNAPSHOT_CACHE_WRITE_SECONDS:
+            self._write_cache()
+        return len(new_rows)
+
+    def start(self):
+        """Start the background refresher."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="content-snapshot-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing content snapshot: {e}")
+
+    def _signature(self):
+        """Identifies how the frame was built; a file with another signature is stale."""
+        layout = repr((SNAPSHOT_FORMAT_VERSION, CONTENT_LIST_COLUMNS, SNAPSHOT_DROP_COLUMNS, self.compact))
+        return hashlib.sha256(layout.encode('utf-8')).hexdigest()
+
+    def _read_cache(self):
+        """Return (frame, watermark, max id) saved in SNAPSHOT_CACHE_PATH, or None when
+        missing or written with another layout.
+
+        The frame is as current as its row_version watermark: the caller merges the rows
+        changed since then and checks for deletes with _covers_database.
+        """
+        if not SNAPSHOT_CACHE_PATH or not os.path.exists(SNAPSHOT_CACHE_PATH):
+            return None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(SNAPSHOT_CACHE_PATH, 'r')).read_all()
+            metadata = json.loads(table.schema.metadata[b'content_snapshot'])
+        except (OSError, KeyError, ValueError, TypeError, pa.ArrowException) as e:
+            logging.error(f"Ignoring unreadable snapshot cache {SNAPSHOT_CACHE_PATH}: {e}")
+            return None
+        if metadata.get('signature') != self._signature():
+            logging.warning("Ignoring snapshot cache written with a different layout.")
+            return None
+        string_types = {pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}
+        data = table.to_pandas(types_mapper=string_types.get)
+        data = compact_content_frame(data) if self.compact else data
+        return data, metadata['watermark'], metadata['max_id']
+
+    def _covers_database(self, max_id):
+        """Whether the table still has every row of the snapshot with id <= max_id."""
+        count = self.db_manager.content_count(max_id)
+        return count is not None and count >= int((self._data['id'] <= max_id).sum())
+
+    def _write_cache(self):
+        """Save the published frame with the row_version watermark it is current to. Atomic.
+
+        The watermark comes from the rows themselves, so a file never claims changes that
+        were made after its rows were read.
+        """
+        data, watermark = self._data, self._watermark
+        if not SNAPSHOT_CACHE_PATH or data.empty or watermark is None:
+            return
+        self._last_write = time.monotonic()
+        metadata = {'signature': self._signature(), 'watermark': watermark, 'max_id': int(data['id'].max())}
+        temp_path = f"{SNAPSHOT_CACHE_PATH}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(SNAPSHOT_CACHE_PATH) or ".", exist_ok=True)
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b'content_snapshot': json.dumps(metadata).encode('utf-8'),
+            })
+            with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(temp_path, SNAPSHOT_CACHE_PATH)
+        except (OSError, pa.ArrowException) as e:
+            logging.error(f"Error writing snapshot cache {SNAPSHOT_CACHE_PATH}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _prepare(self, rows):
+        rows = rows.drop(columns=[column for column in SNAPSHOT_DROP_COLUMNS if column in rows])
+        if 'date' in rows:
+            rows['date'] = pd.to_datetime(rows['date'])
+        if 'url' in rows:
+            # domain is stored at ingest time; only rows not backfilled yet need parsing
+            if 'domain' not in rows:
+                rows['domain'] = None
+            missing = rows['domain'].isna() & rows['url'].notna()
+            if missing.any():
+                rows.loc[missing, 'domain'] = extract_domains(rows.loc[missing, 'url'])
+        return compact_content_frame(rows) if self.compact else rows
+
+    @staticmethod
+    def _version_of(rows):
+        return int(rows['row_version'].max()) if not rows.empty else None
+
+    def _merge(self, rows, watermark):
+        merged = pd.concat([rows, self._data], ignore_index=True)
+        merged = merged.drop_duplicates(subset='id', keep='first')
+        merged = merged.sort_values(by='date', ascending=False, kind='mergesort', ignore_index=True)
+        if self.compact:
+            # Concatenating categoricals with different categories falls back to object
+            merged = compact_content_frame(merged)
+        self._publish(merged, max(self._watermark or 0, watermark or 0) or None)
+
+    def _publish(self, data, watermark):
+        if not data.empty:
+            data = data.set_index(pd.Index(data['id'], name=None), drop=False)
+        self._watermark = watermark
+        self._data = data
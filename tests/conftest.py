@@ -0,0 +1,98 @@
+import http.server
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubOpenAI:
+    """Local HTTP server that answers each request with the next scripted reply.
+
+    A reply is a callable taking the request handler, see json_reply and sse_reply.
+    Request bodies are recorded in requests.
+    """
+
+    def __init__(self):
+        self.replies = []
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                stub.requests.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                stub.replies.pop(0)(self)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # Replies written after the client gave up (timeout tests) fail harmlessly
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def json_reply(body, status=200, headers=None):
+    def reply(handler):
+        data = json.dumps(body).encode('utf-8')
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+    return reply
+
+
+def chat_reply(content):
+    return json_reply({'choices': [{'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}]})
+
+
+def sse_reply(deltas, finish=True, done=True):
+    """Stream deltas as chat-completion chunks, optionally without the finish_reason
+    chunk and the [DONE] marker, then close the connection cleanly."""
+    def reply(handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        for delta in deltas:
+            event = {'choices': [{'delta': {'content': delta}, 'finish_reason': None}]}
+            handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+        if finish:
+            event = {'choices': [{'delta': {}, 'finish_reason': 'stop'}]}
+            handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+        if done:
+            handler.wfile.write(b"data: [DONE]\n\n")
+    return reply
+
+
+@pytest.fixture
+def stub_openai():
+    stub = StubOpenAI()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    import gpt_request
+    cache = gpt_request.ResponseCache(path=str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(gpt_request, '_response_cache', cache)
+    return cache
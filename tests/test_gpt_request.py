@@ -0,0 +1,138 @@
+import time
+
+import pytest
+import requests
+
+import gpt_request
+from conftest import chat_reply, json_reply, sse_reply
+
+CHAT_PAYLOAD = {"model": "test-model", "messages": [{"role": "user", "content": "Hello"}], "max_tokens": 10}
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault('max_retries', 2)
+    return gpt_request.OpenAIClient("test-key", base_url=stub.url, limiter=gpt_request.TokenBucket(1000, 1000), **kwargs)
+
+
+def test_stream_yields_deltas_and_caches_the_complete_answer(stub_openai, response_cache):
+    stub_openai.replies = [sse_reply(["Hel", "lo"])]
+    client = make_client(stub_openai)
+
+    assert list(client.stream("/chat/completions", CHAT_PAYLOAD, cache=True)) == ["Hel", "lo"]
+    assert stub_openai.requests[0]["stream"] is True
+
+    # Answered from the cache, by both the streaming and the plain call
+    assert list(client.stream("/chat/completions", CHAT_PAYLOAD, cache=True)) == ["Hello"]
+    assert client.post("/chat/completions", CHAT_PAYLOAD, cache=True)["choices"][0]["message"]["content"] == "Hello"
+    assert len(stub_openai.requests) == 1
+
+
+@pytest.mark.parametrize("done", [True, False])
+def test_stream_without_finish_reason_raises_and_is_not_cached(stub_openai, response_cache, done):
+    stub_openai.replies = [sse_reply(["Hel", "lo"], finish=False, done=done)]
+    client = make_client(stub_openai)
+
+    received = []
+    with pytest.raises(requests.exceptions.RequestException):
+        for delta in client.stream("/chat/completions", CHAT_PAYLOAD, cache=True):
+            received.append(delta)
+    assert received == ["Hel", "lo"]
+    assert response_cache.get(gpt_request.cache_key("/chat/completions", CHAT_PAYLOAD)) is None
+
+
+def test_translation_stream_reraises_truncated_stream(stub_openai, response_cache, monkeypatch):
+    stub_openai.replies = [sse_reply(["<p>سلام"], finish=False, done=False)]
+    monkeypatch.setattr(gpt_request, 'get_client', lambda api_key: make_client(stub_openai))
+
+    with pytest.raises(requests.exceptions.RequestException):
+        list(gpt_request.Translation("test-model", "test-key").gpt_translate_stream("<p>Hi</p>", "en", "fa"))
+
+
+def test_post_uses_the_cache(stub_openai, response_cache):
+    stub_openai.replies = [chat_reply("Hi")]
+    client = make_client(stub_openai)
+
+    for _ in range(2):
+        assert client.post("/chat/completions", CHAT_PAYLOAD, cache=True)["choices"][0]["message"]["content"] == "Hi"
+    assert len(stub_openai.requests) == 1
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(gpt_request, 'OPENAI_BACKOFF_BASE', 0.01)
+
+
+def test_retries_429_and_5xx_then_succeeds(stub_openai, fast_backoff):
+    stub_openai.replies = [
+        json_reply({'error': {'code': 'rate_limit_exceeded'}}, status=429),
+        json_reply({'error': {'message': 'overloaded'}}, status=503),
+        chat_reply("Hi"),
+    ]
+    client = make_client(stub_openai)
+
+    assert client.post("/chat/completions", CHAT_PAYLOAD)["choices"][0]["message"]["content"] == "Hi"
+    assert len(stub_openai.requests) == 3
+
+
+def test_honors_retry_after(stub_openai, fast_backoff):
+    stub_openai.replies = [json_reply({}, status=429, headers={'Retry-After': '1'}), chat_reply("Hi")]
+    client = make_client(stub_openai)
+
+    started = time.monotonic()
+    client.post("/chat/completions", CHAT_PAYLOAD)
+    assert time.monotonic() - started >= 1
+
+
+def test_raises_after_exhausting_retries(stub_openai, fast_backoff):
+    stub_openai.replies = [json_reply({}, status=500) for _ in range(3)]
+    client = make_client(stub_openai, max_retries=2)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post("/chat/completions", CHAT_PAYLOAD)
+    assert len(stub_openai.requests) == 3
+
+
+def test_insufficient_quota_is_not_retried(stub_openai, fast_backoff):
+    stub_openai.replies = [json_reply({'error': {'code': 'insufficient_quota', 'type': 'insufficient_quota'}}, status=429)]
+    client = make_client(stub_openai)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post("/chat/completions", CHAT_PAYLOAD)
+    assert len(stub_openai.requests) == 1
+
+
+def test_read_timeout_of_a_completion_is_not_retried(stub_openai, fast_backoff):
+    def slow_reply(handler):
+        time.sleep(0.5)
+        chat_reply("late")(handler)
+
+    stub_openai.replies = [slow_reply, chat_reply("Hi")]
+    client = make_client(stub_openai, timeout=(1, 0.1))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post("/chat/completions", CHAT_PAYLOAD)
+    assert len(stub_openai.requests) == 1
+
+
+def test_answers_without_content_are_not_cached(stub_openai, response_cache):
+    filtered = json_reply({'choices': [{'message': {'role': 'assistant', 'content': None}, 'finish_reason': 'content_filter'}]})
+    stub_openai.replies = [filtered, json_reply({'choices': []}), chat_reply("Hi")]
+    client = make_client(stub_openai)
+
+    for _ in range(3):
+        client.post("/chat/completions", CHAT_PAYLOAD, cache=True)
+    assert len(stub_openai.requests) == 3
+    # Only the usable answer was stored; the stream reads it back as text
+    assert list(client.stream("/chat/completions", CHAT_PAYLOAD, cache=True)) == ["Hi"]
+
+
+def test_cache_counters_are_kept_in_the_file(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = gpt_request.ResponseCache(path=path)
+    cache.put("key", {'choices': [{'message': {'content': "Hi"}}]})
+    cache.get("key")
+    cache.get("other")
+
+    assert gpt_request.ResponseCache(path=path).stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'bytes': cache.stats()['bytes']}
+    cache.clear()
+    assert gpt_request.ResponseCache(path=path).stats()['hits'] == 0
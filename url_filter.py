@@ -0,0 +1,80 @@
+import hashlib
+import math
+import os
+import struct
+
+_HEADER = struct.Struct("<4sQQQQq")
+_MAGIC = b"BLM1"
+
+
+class BloomFilter:
+    """Probabilistic set of strings: no false negatives, false positives at about error_rate.
+
+    watermark records the highest Content.id whose URL has been added, so a filter loaded
+    from disk can be topped up with only the rows inserted since it was saved.
+    """
+
+    def __init__(self, capacity, error_rate=0.01, watermark=0):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.num_bits = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.watermark = watermark
+
+    def _positions(self, item):
+        # Double hashing: k positions derived from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        """Add item. count only grows when a bit was newly set, so adding a URL again
+        (e.g. remembered at insert time, then read back by the next top-up) is free."""
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def is_full(self):
+        return self.count > self.capacity
+
+    def save(self, path):
+        """Write the filter atomically, so a crash never leaves a truncated file behind."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.num_bits, self.num_hashes, self.capacity, self.count, self.watermark))
+            f.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a filter written by save(). Raises ValueError for empty, truncated or foreign files."""
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"{path} is truncated")
+            magic, num_bits, num_hashes, capacity, count, watermark = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a saved Bloom filter")
+            bits = bytearray(f.read())
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        bloom.bits = bits
+        bloom.count = count
+        bloom.watermark = watermark
+        return bloom